@@ -0,0 +1,127 @@
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import sys
+from functools import lru_cache
+from dataclasses import dataclass, asdict
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from container import Container, build_root, city_scope
+from entities import count_ticks
+from services import GameService, RESOURCE_CAPACITIES
+
+Action = Tuple
+RESOURCE_NAMES = tuple(RESOURCE_CAPACITIES)
+
+
+@dataclass
+class CityResult:
+    city: int
+    seed: int
+    resources: Tuple[int, ...]
+    buildings: int
+    ok: int
+    failed: int
+    starvation_ticks: int
+    drought_ticks: int
+
+
+def city_seed(base_seed: int, city: int) -> int:
+    return base_seed * 1_000_003 + city
+
+
+def apply_action(gs: GameService, action: Action) -> Tuple[bool, int, int]:
+    op, *args = action
+    if op == 'tick':
+        report = gs.advance(int(args[0]) if args else 1)
+        return True, count_ticks(report.starvation_ticks), count_ticks(report.drought_ticks)
+    if op == 'build':
+        ok, _ = gs.build(args[0])
+    elif op == 'upgrade':
+        ok, _ = gs.upgrade(int(args[0]))
+    elif op == 'research':
+        ok, _ = gs.research_tech(args[0])
+    elif op == 'ship':
+        ok, _ = gs.build_ship()
+    elif op == 'raid':
+        ok, _ = gs.raid()
+    elif op == 'trade':
+        city, offer = args
+        if isinstance(city, int):
+            cities = gs.get_trading_cities()
+            city = cities[city] if 0 <= city < len(cities) else ''
+        ok, _ = gs.trade(city, int(offer))
+    else:
+        raise ValueError(f"Unknown action: {op}")
+    return ok, 0, 0
+
+
+@lru_cache(maxsize=None)
+def _worker_root(options: tuple) -> Container:
+    # One root per worker process and set of options, so every city the
+    # worker runs shares the same catalog and tech tree.
+    return build_root(**dict(options))
+
+
+def run_city(city: int, script: Sequence[Action], base_seed: int = 0, root: Optional[Container] = None,
+             **container_kwargs) -> CityResult:
+    seed = city_seed(base_seed, city)
+    if root is not None and container_kwargs:
+        raise ValueError("A shared root already fixes the container options; pass either root or options")
+    if root is None:
+        options = {k: tuple(v) if isinstance(v, list) else v for k, v in container_kwargs.items()}
+        root = _worker_root(tuple(sorted(options.items())))
+    c = city_scope(root, seed)
+    gs = c.resolve('game_service')
+    rm = c.resolve('resource_manager')
+
+    ok = failed = starvation = drought = 0
+    for action in script:
+        success, starved, dry = apply_action(gs, action)
+        ok += success
+        failed += not success
+        starvation += starved
+        drought += dry
+
+    resources = tuple(rm.get_amount(r) for r in RESOURCE_NAMES)
+    return CityResult(city, seed, resources, len(c.resolve('building_repo')), ok, failed, starvation, drought)
+
+
+def _run_job(job: tuple) -> CityResult:
+    city, script, base_seed, container_kwargs = job
+    return run_city(city, script, base_seed, **container_kwargs)
+
+
+def run_batch(scripts: Iterable[Sequence[Action]], workers: Optional[int] = None, seed: int = 0,
+              chunksize: int = 16, **container_kwargs) -> Iterator[CityResult]:
+    jobs = ((city, list(script), seed, container_kwargs) for city, script in enumerate(scripts))
+    if workers == 1:
+        yield from map(_run_job, jobs)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap_unordered(_run_job, jobs, chunksize)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run scripted cities in parallel")
+    parser.add_argument('scripts', help="JSON-lines file, one list of actions per city ('-' for stdin)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunksize', type=int, default=16)
+    parser.add_argument('--vectorized', action='store_true')
+    parser.add_argument('--compact', action='store_true')
+    args = parser.parse_args()
+
+    source = sys.stdin if args.scripts == '-' else open(args.scripts)
+    with source:
+        scripts: List[list] = [json.loads(line) for line in source if line.strip()]
+
+    results = run_batch(scripts, args.workers, args.seed, args.chunksize,
+                        vectorized=args.vectorized, compact=args.compact)
+    for result in results:
+        print(json.dumps(asdict(result)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+from __future__ import annotations
+import argparse
+import contextlib
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from container import Container, build_container
+from repositories import BuildingRepository, CompactBuildingRepository
+from services import BuildingFactory, GameService
+from snapshot import load_snapshot, save_snapshot
+
+KINDS = [
+    'house', 'farm', 'lumber_mill', 'quarry', 'school', 'library', 'park', 'carpenter',
+    'water_tower', 'port', 'coal_mine', 'mine', 'metallurgy_plant', 'concrete_factory',
+    'sand_quarry', 'university', 'science_lab', 'power_plant', 'warehouse', 'logistics_center'
+]
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.txt')
+
+REPOSITORY_MODES = {
+    'objects': BuildingRepository,
+    'compact': CompactBuildingRepository,
+}
+
+
+def populate(repo: BuildingRepository, n_buildings: int) -> BuildingRepository:
+    factory = BuildingFactory()
+    for i in range(n_buildings):
+        repo.add(factory.create(KINDS[i % len(KINDS)]))
+    return repo
+
+
+def measure_memory(make_repo: Callable[[], BuildingRepository], n_buildings: int) -> tuple[int, int]:
+    populate(make_repo(), len(KINDS))
+    gc.collect()
+    tracemalloc.start()
+    repo = populate(make_repo(), n_buildings)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del repo
+    return current, peak
+
+
+def bench_memory(args: argparse.Namespace) -> None:
+    print(f"{'mode':<10} {'buildings':>10} {'retained':>12} {'peak':>12} {'bytes/bldg':>11}")
+    for mode, make_repo in REPOSITORY_MODES.items():
+        current, peak = measure_memory(make_repo, args.buildings)
+        print(f"{mode:<10} {args.buildings:>10} {current:>12} {peak:>12} {current / args.buildings:>11.1f}")
+
+
+def bench_snapshot(args: argparse.Namespace) -> None:
+    print(f"{'mode':<10} {'buildings':>10} {'save ms':>10} {'load ms':>10} {'size KiB':>10}")
+    for mode in REPOSITORY_MODES:
+        compact = mode == 'compact'
+        c = build_container(compact=compact)
+        factory = c.resolve('building_factory')
+        repo = c.resolve('building_repo')
+        for i in range(args.buildings):
+            repo.add(factory.create(KINDS[i % len(KINDS)]))
+
+        fd, path = tempfile.mkstemp(suffix='.snap')
+        os.close(fd)
+        try:
+            t0 = time.perf_counter()
+            save_snapshot(c, path)
+            t1 = time.perf_counter()
+            restored = load_snapshot(path, compact=compact)
+            t2 = time.perf_counter()
+            assert len(restored.resolve('building_repo')) == args.buildings
+            size = os.path.getsize(path)
+        finally:
+            os.remove(path)
+        print(f"{mode:<10} {args.buildings:>10} {(t1 - t0) * 1e3:>10.1f} {(t2 - t1) * 1e3:>10.1f} {size / 1024:>10.1f}")
+
+
+def synthetic_city(n_buildings: int, seed: int = 0, **container_kwargs) -> Container:
+    c = build_container(seed=seed, **container_kwargs)
+    populate(c.resolve('building_repo'), n_buildings)
+    c.resolve('building_factory').restore_state(n_buildings)
+    research = c.resolve('research_service')
+    research.restore_state(list(research.tech_tree))
+    refill(c)
+    return c
+
+
+def refill(c: Container) -> None:
+    rm = c.resolve('resource_manager')
+    for rid in range(len(rm.amounts)):
+        rm.capacities[rid] = max(rm.capacities[rid], 10 ** 12)
+        rm.amounts[rid] = 10 ** 11
+
+
+def _op_tick(c: Container) -> Callable[[], None]:
+    return c.resolve('production_service').tick
+
+
+def _op_build(c: Container) -> Callable[[], None]:
+    gs = c.resolve('game_service')
+    return lambda: gs.build('house')
+
+
+def _op_upgrade(c: Container) -> Callable[[], None]:
+    constr = c.resolve('construction_service')
+    n = max(1, len(c.resolve('building_repo')))
+    state = {'next': 0}
+
+    def op() -> None:
+        state['next'] = state['next'] % n + 1
+        constr.upgrade_building(state['next'])
+    return op
+
+
+def _op_trade(c: Container) -> Callable[[], None]:
+    trading = c.resolve('trading_service')
+    city = trading.get_active_cities()[0]
+    n = len(trading.get_offers(city))
+    state = {'next': 0}
+
+    def op() -> None:
+        state['next'] = (state['next'] + 1) % n
+        trading.execute_trade(city, state['next'])
+    return op
+
+
+def _op_raid(c: Container) -> Callable[[], None]:
+    raid = c.resolve('raid_service')
+    rm = c.resolve('resource_manager')
+
+    def op() -> None:
+        rm.add_resource('ship', 2)
+        raid.execute_raid()
+    return op
+
+
+OPERATIONS: Dict[str, Callable[[Container], Callable[[], None]]] = {
+    'tick': _op_tick,
+    'build': _op_build,
+    'upgrade': _op_upgrade,
+    'trade': _op_trade,
+    'raid': _op_raid,
+}
+
+
+def time_op(op: Callable[[], None], min_time: float, max_repeat: int) -> tuple[float, int]:
+    runs = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while runs < max_repeat and (runs == 0 or elapsed < min_time):
+        op()
+        runs += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / runs, runs
+
+
+def peak_memory(op: Callable[[], None]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    op()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run_suite(sizes: List[int], container_kwargs: dict, min_time: float, max_repeat: int) -> List[dict]:
+    mode = '+'.join(k for k, v in sorted(container_kwargs.items()) if v) or 'default'
+    records = []
+
+    def record(name: str, n: int, seconds: float, runs: int, peak: int) -> None:
+        rec = {'bench': name, 'buildings': n, 'mode': mode, 'seconds': seconds, 'runs': runs, 'peak_bytes': peak}
+        records.append(rec)
+        print(f"{name:<10} {n:>9} {mode:<12} {seconds * 1e3:>12.3f} {runs:>6} {peak / 1024:>12.1f}")
+
+    print(f"{'bench':<10} {'buildings':>9} {'mode':<12} {'ms/op':>12} {'runs':>6} {'peak KiB':>12}")
+    def startup() -> None:
+        # Providers are lazy, so a startup is only complete once the game
+        # service and everything it depends on has been built.
+        c = build_container(**container_kwargs)
+        c.resolve('game_service')
+        for name in GameService._DEPENDENCIES.values():
+            c.resolve(name)
+
+    startup()
+    seconds, runs = time_op(startup, min_time, max_repeat)
+    record('startup', 0, seconds, runs, peak_memory(startup))
+
+    with open(os.devnull, 'w') as devnull:
+        for n in sizes:
+            c = synthetic_city(n, **container_kwargs)
+            for name, make_op in OPERATIONS.items():
+                op = make_op(c)
+                with contextlib.redirect_stdout(devnull):
+                    op()
+                    seconds, runs = time_op(op, min_time, max_repeat)
+                    refill(c)
+                    peak = peak_memory(op)
+                    refill(c)
+                record(name, n, seconds, runs, peak)
+            del c
+    return records
+
+
+def _key(rec: dict) -> tuple:
+    return rec['bench'], rec['buildings'], rec['mode']
+
+
+def read_records(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(records: List[dict], baseline_path: str, tolerance: float) -> int:
+    baseline = {_key(r): r for r in read_records(baseline_path)}
+    regressions = 0
+    print(f"\n{'bench':<10} {'buildings':>9} {'mode':<12} {'time x':>8} {'memory x':>9}")
+    for rec in records:
+        base = baseline.get(_key(rec))
+        if base is None:
+            continue
+        time_ratio = rec['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+        mem_ratio = rec['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else 1.0
+        flag = ''
+        if time_ratio > tolerance or mem_ratio > tolerance:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"{rec['bench']:<10} {rec['buildings']:>9} {rec['mode']:<12} {time_ratio:>8.2f} {mem_ratio:>9.2f}{flag}")
+    return regressions
+
+
+def write_records(records: List[dict], path: str) -> None:
+    with open(path, 'w') as f:
+        for rec in records:
+            f.write(json.dumps(rec) + '\n')
+
+
+def bench_suite(args: argparse.Namespace) -> None:
+    sizes = [int(float(s)) for s in args.sizes.split(',')]
+    kwargs = {'vectorized': args.vectorized, 'compact': args.compact}
+    records = run_suite(sizes, kwargs, args.min_time, args.max_repeat)
+    write_records(records, args.output)
+    if args.save_baseline:
+        # Results of other modes and sizes already in the baseline are kept.
+        keys = {_key(rec) for rec in records}
+        kept = read_records(args.save_baseline) if os.path.exists(args.save_baseline) else []
+        write_records([r for r in kept if _key(r) not in keys] + records, args.save_baseline)
+    if args.baseline and compare(records, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="City builder benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    memory = sub.add_parser('memory', help="compare building repository memory modes")
+    memory.add_argument('--buildings', type=int, default=100_000)
+    memory.set_defaults(func=bench_memory)
+
+    snapshot = sub.add_parser('snapshot', help="time saving and loading a city snapshot")
+    snapshot.add_argument('--buildings', type=int, default=100_000)
+    snapshot.set_defaults(func=bench_snapshot)
+
+    suite = sub.add_parser('suite', help="time tick/build/upgrade/trade/raid/startup on synthetic cities")
+    suite.add_argument('--sizes', default='1e2,1e3,1e4', help="comma-separated building counts, up to 1e6")
+    suite.add_argument('--vectorized', action='store_true')
+    suite.add_argument('--compact', action='store_true')
+    suite.add_argument('--min-time', type=float, default=0.2, help="seconds to spend timing each operation")
+    suite.add_argument('--max-repeat', type=int, default=1000)
+    suite.add_argument('--output', default='bench_output.txt')
+    suite.add_argument('--baseline', default=BASELINE_PATH if os.path.exists(BASELINE_PATH) else None,
+                       help="JSON-lines results to compare against (default: the committed bench_baseline.txt)")
+    suite.add_argument('--save-baseline', help="also write these results as a new baseline")
+    suite.add_argument('--tolerance', type=float, default=1.25, help="ratio above which a result is a regression")
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+from __future__ import annotations
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence
+
+from entities import Building, ProducerBuilding, ProducerStorageBuilding, StorageBuilding, WaterTower, RateTable
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'buildings.json')
+
+BUILDING_CLASSES = {
+    'building': Building,
+    'producer': ProducerBuilding,
+    'producer_storage': ProducerStorageBuilding,
+    'storage': StorageBuilding,
+    'water_tower': WaterTower,
+}
+
+
+class CatalogError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class BuildingSpec:
+    kind: str
+    category: str
+    cls: type
+    cost: Dict[str, int]
+    rates: Optional[RateTable] = None
+    tech: Optional[str] = None
+
+    def create(self, id_: int) -> Building:
+        return self.cls.with_rates(id_, self.kind, self.rates)
+
+
+def _spec(kind: str, category: str, entry: Mapping) -> BuildingSpec:
+    produces = entry.get('produces') or {}
+    consumes = entry.get('consumes') or {}
+    adds_capacity = entry.get('adds_capacity') or {}
+    class_name = entry.get('class') or (
+        ('producer_storage' if adds_capacity else 'producer') if produces else
+        'storage' if adds_capacity else 'building'
+    )
+    cls = BUILDING_CLASSES.get(class_name)
+    if cls is None:
+        raise CatalogError(f"Building '{kind}' has unknown class '{class_name}'")
+    if adds_capacity and not hasattr(cls, 'adds_capacity'):
+        raise CatalogError(f"Building '{kind}' adds capacity, which class '{class_name}' does not apply")
+    rates = RateTable.intern(kind, produces, consumes, adds_capacity) if cls is not Building else None
+    return BuildingSpec(kind, category, cls, dict(entry.get('cost') or {}), rates, entry.get('tech'))
+
+
+class BuildingCatalog:
+    def __init__(self, data: Mapping[str, Mapping[str, Mapping]]):
+        self._specs: Dict[str, BuildingSpec] = {}
+        for category, kinds in data.items():
+            for kind, entry in kinds.items():
+                self._specs[kind] = _spec(kind, category, entry)
+
+        self._categories: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self._by_tech: Dict[Optional[str], List[str]] = {}
+        for spec in self._specs.values():
+            self._categories.setdefault(spec.category, {})[spec.kind] = spec.cost
+            self._by_tech.setdefault(spec.tech, []).append(spec.kind)
+
+    def spec(self, kind: str) -> Optional[BuildingSpec]:
+        return self._specs.get(kind)
+
+    def blueprint(self, kind: str) -> Optional[Dict[str, int]]:
+        spec = self._specs.get(kind)
+        return spec.cost if spec is not None else None
+
+    def categories(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        return self._categories
+
+    def unlocked_by(self, tech: Optional[str]) -> List[str]:
+        return self._by_tech.get(tech, [])
+
+    def techs(self) -> List[str]:
+        return [tech for tech in self._by_tech if tech is not None]
+
+    def __contains__(self, kind: str) -> bool:
+        return kind in self._specs
+
+    def __iter__(self) -> Iterator[BuildingSpec]:
+        return iter(self._specs.values())
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+
+def _merge(paths: Sequence[str]) -> Dict[str, Dict[str, dict]]:
+    # Later files add kinds or replace earlier definitions of the same kind.
+    data: Dict[str, Dict[str, dict]] = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for category, kinds in json.load(f).items():
+                for kind, entry in kinds.items():
+                    for other, existing in data.items():
+                        if other != category:
+                            existing.pop(kind, None)
+                    data.setdefault(category, {})[kind] = entry
+    return data
+
+
+@lru_cache(maxsize=None)
+def load_catalog(*paths: str) -> BuildingCatalog:
+    return BuildingCatalog(_merge(paths or (DEFAULT_CATALOG_PATH,)))
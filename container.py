@@ -1,58 +1,185 @@
-from __future__ import annotations
-from typing import Dict
-
-from repositories import BuildingRepository, ResourceRepository
-from services import (
-    ResourceManager, BuildingFactory, ConstructionService, 
-    ProductionService, GameService, ResearchService, TradingService, RaidService
-)
-
-class Container:
-    def __init__(self):
-        self._singletons: Dict[str, object] = {}
-
-    def register_singleton(self, cls_or_name: str, instance) -> None:
-        self._singletons[cls_or_name] = instance
-
-    def resolve(self, cls_or_name: str):
-        return self._singletons.get(cls_or_name)
-
-def build_container() -> Container:
-    c = Container()
-
-    res_repo = ResourceRepository()
-    bld_repo = BuildingRepository()
-    c.register_singleton('resource_repo', res_repo)
-    c.register_singleton('building_repo', bld_repo)
-
-    rm = ResourceManager(res_repo)
-    factory = BuildingFactory()
-    constr = ConstructionService(rm, bld_repo)
-    prod = ProductionService(bld_repo, rm)
-    research = ResearchService(rm)
-    trading = TradingService(rm)
-    raid = RaidService(rm)  
-
-    c.register_singleton('resource_manager', rm)
-    c.register_singleton('building_factory', factory)
-    c.register_singleton('construction_service', constr)
-    c.register_singleton('production_service', prod)
-    c.register_singleton('research_service', research)
-    c.register_singleton('trading_service', trading)
-    c.register_singleton('raid_service', raid) 
-
-    
-    gs = GameService(rm, bld_repo, factory, constr, prod, research, trading, raid)
-    c.register_singleton('game_service', gs)
-
-    # Стартові ресурси
-    rm.add_resource('wood', 20)
-    rm.add_resource('people', 2)
-    rm.add_resource('stone', 20)
-    rm.add_resource('food', 10)
-    rm.add_resource('iron', 5)
-    rm.add_resource('research_points', 5)
-    rm.add_resource('gold', 50) 
-
-    return c
-
+from __future__ import annotations
+import random
+from typing import Callable, Dict, Optional, Sequence, Set, Tuple
+
+from catalog import load_catalog
+from interfaces import IContainer, ILogger
+from logger import RingBufferLogger
+from repositories import BuildingRepository, CompactBuildingRepository, ResourceRepository
+from services import (
+    ResourceManager, BuildingFactory, ConstructionService, 
+    ProductionService, GameService, ResearchService, TradingService, RaidService, TechTree
+)
+
+SINGLETON, SCOPED = 'singleton', 'scoped'
+
+
+class Container(IContainer):
+    # Providers build instances on first resolve. A singleton is built once by
+    # the container that registered it and shared with every scope below it;
+    # a scoped provider builds one instance per scope that asks for it.
+    def __init__(self, parent: Optional[Container] = None):
+        self._parent = parent
+        self._singletons: Dict[str, object] = {}
+        self._scoped: Dict[str, object] = {}
+        self._providers: Dict[str, Tuple[Callable[[Container], object], str]] = {}
+        self._resolving: Set[str] = set()
+
+    @property
+    def parent(self) -> Optional[Container]:
+        return self._parent
+
+    def register_singleton(self, cls_or_name: str, instance) -> None:
+        self._singletons[cls_or_name] = instance
+
+    def register_factory(self, cls_or_name: str, factory: Callable[[Container], object],
+                         lifetime: str = SINGLETON) -> None:
+        if lifetime not in (SINGLETON, SCOPED):
+            raise ValueError(f"Unknown lifetime '{lifetime}'")
+        self._providers[cls_or_name] = (factory, lifetime)
+
+    def create_scope(self) -> Container:
+        return Container(self)
+
+    def is_resolved(self, cls_or_name: str) -> bool:
+        return cls_or_name in self._singletons or cls_or_name in self._scoped
+
+    def resolve(self, cls_or_name: str):
+        if cls_or_name in self._scoped:
+            return self._scoped[cls_or_name]
+        owner = self
+        while owner is not None:
+            if cls_or_name in owner._singletons:
+                return owner._singletons[cls_or_name]
+            provider = owner._providers.get(cls_or_name)
+            if provider is not None:
+                factory, lifetime = provider
+                if lifetime == SINGLETON:
+                    return owner._build(cls_or_name, factory, owner._singletons)
+                return self._build(cls_or_name, factory, self._scoped)
+            owner = owner._parent
+        return None
+
+    def _build(self, name: str, factory: Callable[[Container], object], cache: Dict[str, object]):
+        if name in self._resolving:
+            raise ValueError(f"Circular dependency while resolving '{name}'")
+        self._resolving.add(name)
+        try:
+            instance = factory(self)
+        finally:
+            self._resolving.discard(name)
+        cache[name] = instance
+        return instance
+
+def service_rng(seed: Optional[int], stream: str) -> random.Random:
+    return random.Random(f"{seed}/{stream}" if seed is not None else None)
+
+
+def _resource_manager(c: Container) -> ResourceManager:
+    rm = ResourceManager(ResourceRepository())
+    # Стартові ресурси
+    rm.add_resource('wood', 20)
+    rm.add_resource('people', 2)
+    rm.add_resource('stone', 20)
+    rm.add_resource('food', 10)
+    rm.add_resource('iron', 5)
+    rm.add_resource('research_points', 5)
+    rm.add_resource('gold', 50)
+    return rm
+
+
+def build_root(vectorized: bool = False, compact: bool = False, catalog_paths: Sequence[str] = (),
+               logger: Optional[ILogger] = None, history: bool = False) -> Container:
+    # Shared, read-only data are singletons; everything that belongs to one
+    # city is scoped, so every city_scope() gets its own on first use.
+    c = Container()
+    c.register_factory('building_catalog', lambda c: load_catalog(*catalog_paths))
+    c.register_factory('tech_tree', lambda c: TechTree(c.resolve('building_catalog')))
+    if logger is not None:
+        c.register_singleton('logger', logger)
+    else:
+        # Without a logger, events are kept in memory and never written anywhere.
+        c.register_factory('logger', lambda c: RingBufferLogger(), SCOPED)
+
+    def production(c: Container) -> ProductionService:
+        args = (c.resolve('building_repo'), c.resolve('resource_manager'), c.resolve('logger'))
+        if vectorized:
+            from engine import VectorizedProductionService
+            prod = VectorizedProductionService(*args)
+        else:
+            prod = ProductionService(*args)
+        if history:
+            prod.set_history(c.resolve('resource_history'))
+        return prod
+
+    def resource_history(c: Container):
+        from history import ResourceHistory
+        return ResourceHistory(c.resolve('resource_repo').names)
+
+    providers = {
+        'resource_manager': _resource_manager,
+        'resource_repo': lambda c: c.resolve('resource_manager')._repo,
+        'building_repo': lambda c: CompactBuildingRepository() if compact else BuildingRepository(),
+        'building_factory': lambda c: BuildingFactory(c.resolve('building_catalog')),
+        'construction_service': lambda c: ConstructionService(c.resolve('resource_manager'), c.resolve('building_repo')),
+        'production_service': production,
+        'research_service': lambda c: ResearchService(c.resolve('resource_manager'), tree=c.resolve('tech_tree')),
+        'trading_service': lambda c: TradingService(c.resolve('resource_manager'), service_rng(c.resolve('seed'), 'trading')),
+        'raid_service': lambda c: RaidService(c.resolve('resource_manager'), service_rng(c.resolve('seed'), 'raid')),
+        'game_service': GameService.from_container,
+    }
+    if history:
+        providers['resource_history'] = resource_history
+    for name, factory in providers.items():
+        c.register_factory(name, factory, SCOPED)
+    return c
+
+
+def city_scope(root: Container, seed: Optional[int] = None) -> Container:
+    c = root.create_scope()
+    c.register_singleton('seed', seed)
+    return c
+
+
+def build_container(vectorized: bool = False, compact: bool = False, seed: Optional[int] = None,
+                    catalog_paths: Sequence[str] = (), logger: Optional[ILogger] = None,
+                    history: bool = False, root: Optional[Container] = None) -> Container:
+    if root is None:
+        root = build_root(vectorized, compact, catalog_paths, logger, history)
+    elif vectorized or compact or catalog_paths or logger is not None or history:
+        raise ValueError("A shared root already fixes the container options; pass either root or options")
+    return city_scope(root, seed)
+
+
+
+def fork_container(c: Container) -> Container:
+    # Buildings are shared copy-on-write with the parent; the rest is small
+    # per-city state that each service copies in its own fork().
+    child = c.parent.create_scope() if c.parent is not None else Container()
+    catalog = c.resolve('building_catalog')
+    child.register_singleton('building_catalog', catalog)
+    logger = c.resolve('logger')
+    child.register_singleton('logger', logger)
+
+    rm = c.resolve('resource_manager').fork()
+    bld_repo = c.resolve('building_repo').fork()
+    child.register_singleton('resource_repo', rm._repo)
+    child.register_singleton('building_repo', bld_repo)
+
+    factory = BuildingFactory(catalog)
+    factory.restore_state(c.resolve('building_factory').snapshot_state())
+    constr = ConstructionService(rm, bld_repo)
+    prod = type(c.resolve('production_service'))(bld_repo, rm, logger)
+    research = c.resolve('research_service').fork(rm)
+    trading = c.resolve('trading_service').fork(rm)
+    raid = c.resolve('raid_service').fork(rm)
+
+    child.register_singleton('resource_manager', rm)
+    child.register_singleton('building_factory', factory)
+    child.register_singleton('construction_service', constr)
+    child.register_singleton('production_service', prod)
+    child.register_singleton('research_service', research)
+    child.register_singleton('trading_service', trading)
+    child.register_singleton('raid_service', raid)
+    child.register_singleton('game_service', GameService(rm, bld_repo, factory, constr, prod, research, trading, raid, catalog))
+    return child
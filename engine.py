@@ -0,0 +1,225 @@
+from __future__ import annotations
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from entities import RaidEstimate
+from interfaces import ILogger
+from repositories import BuildingRepository
+from services import ProductionService, RaidService, ResourceManager, fire_stack
+
+
+class _Batch:
+    # One independent production chain: its (kind, level) stack rows and the
+    # resource columns they touch. Chains share no resources, so each is
+    # solved alone. `fired` holds how many buildings of each stack ran last.
+    __slots__ = ('cols', 'consumes', 'produces', 'counts', 'exact', 'fired')
+
+    def __init__(self, cols: np.ndarray, consumes: np.ndarray, produces: np.ndarray, counts: np.ndarray,
+                 exact: bool):
+        self.cols = cols
+        self.consumes = consumes
+        self.produces = produces
+        self.counts = counts
+        self.exact = exact
+        self.fired = counts.copy()
+
+
+class VectorizedProductionService(ProductionService):
+    # Stacks are evaluated as whole-array passes instead of one at a time. A
+    # pass assumes how many buildings of each stack fire, derives every
+    # resource trajectory with a clamped prefix sum and accepts the longest
+    # prefix whose counts agree, so the result is the same as the sequential
+    # loop.
+    max_rounds = 32
+
+    def __init__(self, building_repo: BuildingRepository, resource_manager: ResourceManager,
+                 logger: Optional[ILogger] = None):
+        super().__init__(building_repo, resource_manager, logger)
+        self._layout_key = None
+        self._layout: List[_Batch] = []
+
+    def _run_producers(self) -> None:
+        self._sync_layout()
+        if not self._layout:
+            return
+
+        with self._rm.transaction():
+            amounts = self._rm.amounts
+            x = np.array(amounts, dtype=np.int64)
+            cap = np.array(self._rm.capacities, dtype=np.int64)
+            if (x > cap).any():
+                # The closed form below relies on amounts never sitting above capacity.
+                super()._run_producers()
+                return
+
+            for batch in self._layout:
+                if batch.exact:
+                    x[batch.cols] = self._solve(batch, x[batch.cols], cap[batch.cols])
+                else:
+                    x[batch.cols] = self._run_sequential(batch, x[batch.cols], cap[batch.cols], 0, batch.fired)
+            amounts[:] = x.tolist()
+
+    def _producer_runner(self) -> Callable[[], None]:
+        return self._run_producers
+
+    def _sync_layout(self) -> None:
+        n_resources = len(self._rm.amounts)
+        key = (self._buildings.version, n_resources)
+        if key == self._layout_key:
+            return
+
+        layout = []
+        for stacks in self.production_batches():
+            consumes = np.zeros((len(stacks), n_resources), dtype=np.int64)
+            produces = np.zeros((len(stacks), n_resources), dtype=np.int64)
+            counts = np.zeros(len(stacks), dtype=np.int64)
+            exact = True
+            for row, stack in enumerate(stacks):
+                cons, prod, overlap = self._resolve_rates(stack.rates)
+                exact = exact and not overlap
+                if cons is None:
+                    continue
+                counts[row] = stack.count
+                for rid, amount in cons:
+                    consumes[row, rid] = amount
+                for rid, amount in prod:
+                    produces[row, rid] = amount
+            cols = np.flatnonzero((consumes != 0).any(axis=0) | (produces != 0).any(axis=0))
+            layout.append(_Batch(cols, consumes[:, cols], produces[:, cols], counts, exact))
+
+        self._layout_key = key
+        self._layout = layout
+
+    def _fireable(self, batch: _Batch, before: np.ndarray, start: int) -> np.ndarray:
+        need = batch.consumes[start:]
+        counts = batch.counts[start:]
+        covered = np.where(need > 0, before // np.maximum(need, 1), counts[:, None])
+        return np.minimum(covered.min(axis=1, initial=np.iinfo(np.int64).max), counts)
+
+    def _solve(self, batch: _Batch, x: np.ndarray, cap: np.ndarray) -> np.ndarray:
+        fired = batch.fired.copy()
+        n = len(fired)
+        start = 0
+        for _ in range(self.max_rounds):
+            before, after = self._trajectory(batch, x, cap, start, fired[start:])
+            fires = self._fireable(batch, before, start)
+            diff = np.flatnonzero(fires != fired[start:])
+            if not diff.size:
+                batch.fired = fired
+                return after
+
+            k = start + int(diff[0])
+            fired[k:] = fires[k - start:]
+            x = before[k - start]
+            if fired[k]:
+                x = np.minimum(x + fired[k] * (batch.produces[k] - batch.consumes[k]), cap)
+            start = k + 1
+            if start == n:
+                batch.fired = fired
+                return x
+
+        x = self._run_sequential(batch, x, cap, start, fired)
+        batch.fired = fired
+        return x
+
+    def _trajectory(self, batch: _Batch, x: np.ndarray, cap: np.ndarray, start: int, fired: np.ndarray):
+        # Per resource, every event is x -> min(x + d, cap); with x <= cap the
+        # whole sequence reduces to S + min(x0, cap - running_max(S)). A stack
+        # firing k times is one consume and one produce event of k times the rate.
+        m = fired[:, None]
+        events = np.empty((2 * len(fired), len(x)), dtype=np.int64)
+        events[0::2] = -batch.consumes[start:] * m
+        events[1::2] = batch.produces[start:] * m
+        total = np.cumsum(events, axis=0)
+        levels = total + np.minimum(x, cap - np.maximum.accumulate(total, axis=0))
+        after_each = levels[1::2]
+        before = np.concatenate([x[None, :], after_each[:-1]])
+        return before, after_each[-1]
+
+    def _run_sequential(self, batch: _Batch, x: np.ndarray, cap: np.ndarray, start: int,
+                        fired: np.ndarray) -> np.ndarray:
+        amounts = x.tolist()
+        caps = cap.tolist()
+        consumes = batch.consumes.tolist()
+        produces = batch.produces.tolist()
+        counts = batch.counts.tolist()
+        for row in range(start, len(fired)):
+            cons = [(col, amount) for col, amount in enumerate(consumes[row]) if amount]
+            prod = [(col, amount) for col, amount in enumerate(produces[row]) if amount]
+            overlap = bool({col for col, _ in cons} & {col for col, _ in prod})
+            fired[row] = fire_stack(amounts, caps, cons, prod, counts[row], overlap)
+        return np.array(amounts, dtype=np.int64)
+
+
+def estimate_raids(raid: RaidService, ships: int, samples: int, seed: Optional[int] = None,
+                   chunk: int = 1 << 18) -> RaidEstimate:
+    # Draws `samples` raids from the same model as RaidService.execute_raid, a
+    # chunk of raids per array pass, without touching any resources.
+    if ships <= 0:
+        raise ValueError("You have 0 ships! Build a fleet first.")
+    if samples <= 0:
+        raise ValueError("samples must be positive")
+
+    rng = np.random.default_rng(seed)
+    names = list(raid.loot_values)
+    base_qty = raid.loot_budget / np.array([raid.loot_values[r] for r in names], dtype=np.float64)
+    n_types = len(names)
+    low_types, high_types = raid.loot_types
+    low_spread, high_spread = raid.loot_spread
+    low_loss, high_loss = raid.ship_loss
+
+    wins = 0
+    loot_totals = np.zeros(n_types, dtype=np.int64)
+    loot_counts = [np.zeros(0, dtype=np.int64) for _ in names]
+    loss_counts = np.zeros(0, dtype=np.int64)
+
+    remaining = samples
+    while remaining:
+        n = min(chunk, remaining)
+        remaining -= n
+
+        win_chance = rng.uniform(0, raid.base_chance, n) + ships * raid.ship_bonus
+        victory = rng.uniform(0, raid.roll_range, n) <= win_chance
+        n_wins = int(victory.sum())
+        wins += n_wins
+
+        if n_wins:
+            # A uniformly random k-subset per raid: rank random keys and keep the k smallest.
+            k = rng.integers(low_types, high_types + 1, n_wins)
+            ranks = rng.random((n_wins, n_types)).argsort(axis=1).argsort(axis=1)
+            chosen = ranks < k[:, None]
+            qty = np.maximum(1, (base_qty * rng.uniform(low_spread, high_spread, (n_wins, n_types))).astype(np.int64))
+            qty[~chosen] = 0
+            loot_totals += qty.sum(axis=0)
+            for col in range(n_types):
+                counts = np.bincount(qty[:, col])
+                loot_counts[col] = _add_counts(loot_counts[col], counts)
+
+        n_losses = n - n_wins
+        if n_losses:
+            lost = np.minimum(ships, rng.integers(low_loss, high_loss + 1, n_losses))
+            loss_counts = _add_counts(loss_counts, np.bincount(lost))
+
+    loss_counts = _add_counts(loss_counts, np.array([wins], dtype=np.int64))
+    loot_counts = [_add_counts(counts, np.array([samples - wins], dtype=np.int64)) for counts in loot_counts]
+    return RaidEstimate(
+        ships=ships,
+        samples=samples,
+        win_probability=wins / samples,
+        expected_loot={r: float(total) / samples for r, total in zip(names, loot_totals)},
+        loot_distribution={
+            r: {int(q): int(c) / samples for q, c in enumerate(counts) if c}
+            for r, counts in zip(names, loot_counts)
+        },
+        ship_loss_distribution={int(q): int(c) / samples for q, c in enumerate(loss_counts) if c},
+        expected_ships_lost=float(np.dot(np.arange(len(loss_counts)), loss_counts)) / samples,
+    )
+
+
+def _add_counts(total: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    if len(counts) > len(total):
+        total, counts = counts, total
+    total = total.copy()
+    total[:len(counts)] += counts
+    return total
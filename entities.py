@@ -1,100 +1,244 @@
-from __future__ import annotations
-from typing import Dict
-from interfaces import IResource, IBuilding
-
-class Resource(IResource):
-    def __init__(self, name: str, amount: int = 0):
-        self._name = name
-        self._amount = amount
-
-    @property
-    def name(self) -> str:
-        return self._name
-
-    @property
-    def amount(self) -> int:
-        return self._amount
-
-    @amount.setter
-    def amount(self, value: int) -> None:
-        self._amount = value
-
-    def __repr__(self) -> str:
-        return f"{self._name}: {self._amount}"
-
-
-class Building(IBuilding):
-    def __init__(self, id_: int, kind: str):
-        self._id = id_
-        self._kind = kind
-        self._level = 1
-
-    @property
-    def id(self) -> int:
-        return self._id
-
-    @property
-    def kind(self) -> str:
-        return self._kind
-    
-    @property
-    def level(self) -> int:
-        return self._level
-
-    def upgrade(self) -> None:
-        self._level += 1
-
-    def summary(self) -> str:
-        return f"#{self._id} [{self._kind}] (Lvl {self._level})"
-
-
-class ProducerBuilding(Building):
-    def __init__(self, id_: int, kind: str, produces: Dict[str, int], consumes: Dict[str, int] = None):
-        super().__init__(id_, kind)
-        self._base_produces = produces
-        self._base_consumes = consumes or {}
-
-    @property
-    def produces(self) -> Dict[str, int]:
-        multiplier = 1 + (self._level - 1) * 0.5
-        return {k: int(v * multiplier) for k, v in self._base_produces.items()}
-
-    @property
-    def consumes(self) -> Dict[str, int]:
-        multiplier = 1 + (self._level - 1) * 0.2
-        return {k: int(v * multiplier) for k, v in self._base_consumes.items()}
-
-    def summary(self) -> str:
-        base = super().summary()
-        prod_str = ", ".join([f"+{v} {k}" for k, v in self.produces.items()])
-        cons_str = ", ".join([f"-{v} {k}" for k, v in self.consumes.items()])
-        info = prod_str
-        if cons_str:
-            info += f" | {cons_str}"
-        return f"{base} -> {info}"
-
-
-class StorageBuilding(Building):
-    def __init__(self, id_: int, kind: str, adds_capacity: Dict[str, int]):
-        super().__init__(id_, kind)
-        self._base_capacity = adds_capacity
-
-    @property
-    def adds_capacity(self) -> Dict[str, int]:
-        multiplier = self._level
-        return {k: v * multiplier for k, v in self._base_capacity.items()}
-
-
-class WaterTower(ProducerBuilding):
-    def __init__(self, id_: int, kind: str):
-        super().__init__(id_, kind, produces={'water': 10}, consumes={'energy': 1})
-        self._base_capacity = {'water': 300}
-
-    @property
-    def adds_capacity(self) -> Dict[str, int]:
-        multiplier = self._level
-        return {k: v * multiplier for k, v in self._base_capacity.items()}
-
-    def summary(self) -> str:
-        base = super().summary()
-        return f"{base} [Cap: +300 Water]"
+from __future__ import annotations
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+from interfaces import IResource, IBuilding
+
+class Resource(IResource):
+    __slots__ = ('_name', '_amount')
+
+    def __init__(self, name: str, amount: int = 0):
+        self._name = name
+        self._amount = amount
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def amount(self) -> int:
+        return self._amount
+
+    @amount.setter
+    def amount(self, value: int) -> None:
+        self._amount = value
+
+    def __repr__(self) -> str:
+        return f"{self._name}: {self._amount}"
+
+
+class RateTable:
+    # Flyweight shared by every building of the same kind and level.
+    _interned: Dict[tuple, RateTable] = {}
+
+    def __init__(self, base: Optional[RateTable], level: int,
+                 produces: Mapping[str, int], consumes: Mapping[str, int], adds_capacity: Mapping[str, int]):
+        self.base = base or self
+        self.level = level
+        self.produces = MappingProxyType(dict(produces))
+        self.consumes = MappingProxyType(dict(consumes))
+        self.adds_capacity = MappingProxyType(dict(adds_capacity))
+        self._levels: Dict[int, RateTable] = {level: self}
+
+    @classmethod
+    def intern(cls, kind: str, produces: Mapping[str, int] = None, consumes: Mapping[str, int] = None,
+               adds_capacity: Mapping[str, int] = None) -> RateTable:
+        produces = produces or {}
+        consumes = consumes or {}
+        adds_capacity = adds_capacity or {}
+        key = (kind, tuple(produces.items()), tuple(consumes.items()), tuple(adds_capacity.items()))
+        table = cls._interned.get(key)
+        if table is None:
+            table = cls._interned[key] = cls(None, 1, produces, consumes, adds_capacity)
+        return table
+
+    def at_level(self, level: int) -> RateTable:
+        base = self.base
+        table = base._levels.get(level)
+        if table is None:
+            prod_mult = 1 + (level - 1) * 0.5
+            cons_mult = 1 + (level - 1) * 0.2
+            table = base._levels[level] = RateTable(
+                base, level,
+                {k: int(v * prod_mult) for k, v in base.produces.items()},
+                {k: int(v * cons_mult) for k, v in base.consumes.items()},
+                {k: v * level for k, v in base.adds_capacity.items()},
+            )
+        return table
+
+
+class Building(IBuilding):
+    __slots__ = ('_id', '_kind', '_level', '_rates')
+
+    def __init__(self, id_: int, kind: str):
+        self._id = id_
+        self._kind = kind
+        self._level = 1
+        self._rates: Optional[RateTable] = None
+
+    @classmethod
+    def with_rates(cls, id_: int, kind: str, rates: Optional[RateTable]) -> Building:
+        b = cls.__new__(cls)
+        b._id = id_
+        b._kind = kind
+        b._level = 1
+        b._rates = rates
+        return b
+
+    def copy(self) -> Building:
+        b = type(self).with_rates(self._id, self._kind, self._rates)
+        b._level = self._level
+        return b
+
+    @property
+    def id(self) -> int:
+        return self._id
+
+    @property
+    def kind(self) -> str:
+        return self._kind
+    
+    @property
+    def level(self) -> int:
+        return self._level
+
+    @property
+    def rates(self) -> Optional[RateTable]:
+        return self._rates
+
+    def upgrade(self) -> None:
+        self._level += 1
+        if self._rates is not None:
+            self._rates = self._rates.at_level(self._level)
+
+    def summary(self) -> str:
+        return f"#{self._id} [{self._kind}] (Lvl {self._level})"
+
+
+class ProducerBuilding(Building):
+    __slots__ = ()
+
+    def __init__(self, id_: int, kind: str, produces: Dict[str, int], consumes: Dict[str, int] = None):
+        super().__init__(id_, kind)
+        self._rates = RateTable.intern(kind, produces, consumes)
+
+    @property
+    def produces(self) -> Mapping[str, int]:
+        return self._rates.produces
+
+    @property
+    def consumes(self) -> Mapping[str, int]:
+        return self._rates.consumes
+
+    def summary(self) -> str:
+        base = super().summary()
+        prod_str = ", ".join([f"+{v} {k}" for k, v in self.produces.items()])
+        cons_str = ", ".join([f"-{v} {k}" for k, v in self.consumes.items()])
+        info = prod_str
+        if cons_str:
+            info += f" | {cons_str}"
+        return f"{base} -> {info}"
+
+
+class StorageBuilding(Building):
+    __slots__ = ()
+
+    def __init__(self, id_: int, kind: str, adds_capacity: Dict[str, int]):
+        super().__init__(id_, kind)
+        self._rates = RateTable.intern(kind, adds_capacity=adds_capacity)
+
+    @property
+    def adds_capacity(self) -> Mapping[str, int]:
+        return self._rates.adds_capacity
+
+
+class ProducerStorageBuilding(ProducerBuilding):
+    __slots__ = ()
+
+    def __init__(self, id_: int, kind: str, produces: Dict[str, int], consumes: Dict[str, int] = None,
+                 adds_capacity: Dict[str, int] = None):
+        super().__init__(id_, kind, produces, consumes)
+        self._rates = RateTable.intern(kind, self._rates.produces, self._rates.consumes, adds_capacity)
+
+    @property
+    def adds_capacity(self) -> Mapping[str, int]:
+        return self._rates.adds_capacity
+
+    def summary(self) -> str:
+        base = super().summary()
+        caps = ", ".join(f"+{v} {k.title()}" for k, v in self.adds_capacity.items())
+        return f"{base} [Cap: {caps}]"
+
+
+class WaterTower(ProducerStorageBuilding):
+    __slots__ = ()
+
+    def __init__(self, id_: int, kind: str):
+        super().__init__(id_, kind, produces={'water': 10}, consumes={'energy': 1}, adds_capacity={'water': 300})
+
+
+class BuildingStack:
+    # Run-length group of the producers that share a kind and level.
+    __slots__ = ('kind', 'rates', 'count')
+
+    def __init__(self, kind: str, rates: RateTable, count: int = 0):
+        self.kind = kind
+        self.rates = rates
+        self.count = count
+
+    @property
+    def level(self) -> int:
+        return self.rates.level
+
+    def copy(self) -> BuildingStack:
+        return BuildingStack(self.kind, self.rates, self.count)
+
+
+# Flagged ticks are kept as (start, stop, step) runs, each standing for
+# range(start, stop, step), so a report stays small however many ticks it covers.
+TickRuns = List[Tuple[int, int, int]]
+
+
+def add_ticks(runs: TickRuns, start: int, stop: int, step: int = 1) -> None:
+    if start >= stop:
+        return
+    stop = start + (stop - start - 1) // step * step + 1
+    if stop - start == 1:
+        step = 1
+    if runs:
+        s, e, k = runs[-1]
+        single = stop - start == 1
+        if e - s == 1 and start > s and (single or step == start - s):
+            runs[-1] = (s, stop, start - s)
+            return
+        if start == e - 1 + k and (single or step == k):
+            runs[-1] = (s, stop, k)
+            return
+    runs.append((start, stop, step))
+
+
+def count_ticks(runs: TickRuns) -> int:
+    return sum(len(range(*run)) for run in runs)
+
+
+def expand_ticks(runs: TickRuns) -> List[int]:
+    return sorted(t for run in runs for t in range(*run))
+
+
+@dataclass
+class AdvanceReport:
+    ticks: int
+    deltas: Dict[str, int] = field(default_factory=dict)
+    starvation_ticks: TickRuns = field(default_factory=list)
+    drought_ticks: TickRuns = field(default_factory=list)
+
+
+@dataclass
+class RaidEstimate:
+    ships: int
+    samples: int
+    win_probability: float
+    expected_loot: Dict[str, float] = field(default_factory=dict)
+    loot_distribution: Dict[str, Dict[int, float]] = field(default_factory=dict)
+    ship_loss_distribution: Dict[int, float] = field(default_factory=dict)
+    expected_ships_lost: float = 0.0
@@ -0,0 +1,178 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from interfaces import IResourceHistory
+
+
+@dataclass
+class HistoryRange:
+    # One column per point: the first tick it covers and how many ticks it
+    # spans. Recent points are single ticks, older ones downsampled buckets.
+    names: List[str]
+    ticks: np.ndarray
+    counts: np.ndarray
+    mins: np.ndarray
+    maxs: np.ndarray
+    means: np.ndarray
+
+
+class ResourceHistory(IResourceHistory):
+    # The newest ticks are kept per tick, one int64 row per resource. When
+    # that window fills, its older half is folded into min/max/sum buckets of
+    # `width` ticks; when there are too many buckets, neighbours are merged
+    # and the width doubles. Memory stays bounded however long the game runs.
+    def __init__(self, names: Sequence[str], window: int = 4096, max_buckets: int = 4096):
+        if window < 2 or max_buckets < 2:
+            raise ValueError("window and max_buckets must be at least 2")
+        self._names = names
+        self._window = window
+        self._max_buckets = max_buckets
+        self._raw = np.zeros((len(names), window), dtype=np.int64)
+        self._raw_start = 0
+        self._raw_len = 0
+        self._width = 1
+        self._mins = np.zeros((len(names), max_buckets), dtype=np.int64)
+        self._maxs = np.zeros((len(names), max_buckets), dtype=np.int64)
+        self._sums = np.zeros((len(names), max_buckets), dtype=np.int64)
+        self._counts = np.zeros(max_buckets, dtype=np.int64)
+        self._n_buckets = 0
+
+    @property
+    def ticks(self) -> int:
+        return self._raw_start + self._raw_len
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    def record(self, amounts: Sequence[int]) -> None:
+        if len(amounts) > len(self._raw):
+            self._add_rows(len(amounts))
+        if self._raw_len == self._window:
+            self._fold(self._window // 2)
+        self._raw[:len(amounts), self._raw_len] = amounts
+        self._raw_len += 1
+
+    def _add_rows(self, n: int) -> None:
+        # A resource interned mid-game was 0 before it existed.
+        extra = n - len(self._raw)
+        pad = lambda a: np.concatenate([a, np.zeros((extra, a.shape[1]), dtype=a.dtype)])
+        self._raw = pad(self._raw)
+        self._mins = pad(self._mins)
+        self._maxs = pad(self._maxs)
+        self._sums = pad(self._sums)
+
+    def _fold(self, n: int) -> None:
+        chunk = self._raw[:, :n]
+        i = 0
+        while i < n:
+            width = self._width
+            last = self._n_buckets - 1
+            if last >= 0 and self._counts[last] < width:
+                take = min(n - i, width - int(self._counts[last]))
+                part = chunk[:, i:i + take]
+                self._mins[:, last] = np.minimum(self._mins[:, last], part.min(axis=1))
+                self._maxs[:, last] = np.maximum(self._maxs[:, last], part.max(axis=1))
+                self._sums[:, last] += part.sum(axis=1)
+                self._counts[last] += take
+                i += take
+                continue
+            full = (n - i) // width
+            if self._n_buckets + max(full, 1) > self._max_buckets:
+                self._coarsen()
+                continue
+            take = full * width if full else n - i
+            part = chunk[:, i:i + take].reshape(len(chunk), max(full, 1), -1)
+            counts = np.full(full, width) if full else np.array([take])
+            self._append(part.min(axis=2), part.max(axis=2), part.sum(axis=2), counts)
+            i += take
+
+        self._raw[:, :self._raw_len - n] = self._raw[:, n:self._raw_len]
+        self._raw_start += n
+        self._raw_len -= n
+
+    def _append(self, mins: np.ndarray, maxs: np.ndarray, sums: np.ndarray, counts: np.ndarray) -> None:
+        start, end = self._n_buckets, self._n_buckets + len(counts)
+        self._mins[:, start:end] = mins
+        self._maxs[:, start:end] = maxs
+        self._sums[:, start:end] = sums
+        self._counts[start:end] = counts
+        self._n_buckets = end
+
+    def _coarsen(self) -> None:
+        # Merges bucket pairs; every bucket but the last stays exactly `width` long.
+        n = self._n_buckets
+        pairs = n // 2
+        for a, reduce in ((self._mins, np.minimum), (self._maxs, np.maximum), (self._sums, np.add)):
+            merged = reduce(a[:, 0:2 * pairs:2], a[:, 1:2 * pairs:2])
+            if n % 2:
+                merged = np.concatenate([merged, a[:, n - 1:n]], axis=1)
+            a[:, :merged.shape[1]] = merged
+        counts = self._counts[0:2 * pairs:2] + self._counts[1:2 * pairs:2]
+        if n % 2:
+            counts = np.append(counts, self._counts[n - 1])
+        self._counts[:len(counts)] = counts
+        self._n_buckets = len(counts)
+        self._width *= 2
+
+    def range(self, names: Optional[Sequence[str]] = None, start: int = 0, stop: Optional[int] = None) -> HistoryRange:
+        # Every point that overlaps ticks [start, stop), in tick order.
+        all_names = list(self._names)
+        if len(all_names) > len(self._raw):
+            self._add_rows(len(all_names))
+        names = all_names if names is None else list(names)
+        rows = np.array([all_names.index(name) for name in names], dtype=np.intp)
+        stop = self.ticks if stop is None else min(stop, self.ticks)
+
+        counts = self._counts[:self._n_buckets]
+        ends = np.cumsum(counts)
+        firsts = ends - counts
+        b = slice(int(np.searchsorted(ends, start, side='right')), int(np.searchsorted(firsts, stop, side='left')))
+        bucket_counts = counts[b]
+
+        r_lo = max(start - self._raw_start, 0)
+        r_hi = max(stop - self._raw_start, r_lo)
+        raw = self._raw[rows, r_lo:r_hi]
+
+        bucket_rows = (rows[:, None], np.arange(self._n_buckets)[b][None, :])
+        return HistoryRange(
+            names=names,
+            ticks=np.concatenate([firsts[b], np.arange(self._raw_start + r_lo, self._raw_start + r_hi)]),
+            counts=np.concatenate([bucket_counts, np.ones(r_hi - r_lo, dtype=np.int64)]),
+            mins=np.concatenate([self._mins[bucket_rows], raw], axis=1),
+            maxs=np.concatenate([self._maxs[bucket_rows], raw], axis=1),
+            means=np.concatenate([self._sums[bucket_rows] / np.maximum(bucket_counts, 1), raw], axis=1),
+        )
+
+    def latest(self) -> dict:
+        if not self._raw_len:
+            return {}
+        return {name: int(v) for name, v in zip(self._names, self._raw[:, self._raw_len - 1])}
+
+    def to_records(self, names: Optional[Sequence[str]] = None, start: int = 0,
+                   stop: Optional[int] = None) -> np.ndarray:
+        r = self.range(names, start, stop)
+        fields = [('tick', np.int64), ('count', np.int64)]
+        for name in r.names:
+            fields += [(f'{name}_min', np.int64), (f'{name}_max', np.int64), (f'{name}_mean', np.float64)]
+        out = np.empty(len(r.ticks), dtype=fields)
+        out['tick'] = r.ticks
+        out['count'] = r.counts
+        for row, name in enumerate(r.names):
+            out[f'{name}_min'] = r.mins[row]
+            out[f'{name}_max'] = r.maxs[row]
+            out[f'{name}_mean'] = r.means[row]
+        return out
+
+    def save_npy(self, path: str, names: Optional[Sequence[str]] = None, start: int = 0,
+                 stop: Optional[int] = None) -> None:
+        np.save(path, self.to_records(names, start, stop))
+
+    def save_csv(self, path: str, names: Optional[Sequence[str]] = None, start: int = 0,
+                 stop: Optional[int] = None) -> None:
+        records = self.to_records(names, start, stop)
+        fmt = ['%d' if records.dtype[i].kind == 'i' else '%.6g' for i in range(len(records.dtype))]
+        np.savetxt(path, records, fmt=fmt, delimiter=',', header=','.join(records.dtype.names), comments='')
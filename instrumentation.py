@@ -0,0 +1,67 @@
+from __future__ import annotations
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, List, Sequence
+
+from interfaces import ITickProbe
+
+# Upper bucket edges in seconds: 1us .. 1s, then overflow.
+DEFAULT_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+
+
+class TickProfiler(ITickProbe):
+    def __init__(self, keep_records: int = 1000, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._records: Deque[dict] = deque(maxlen=keep_records)
+        self._buckets = tuple(buckets)
+        self._ticks = 0
+        self._phase_totals: Dict[str, float] = {}
+        self._phase_hist: Dict[str, List[int]] = {}
+        self._kind_totals: Dict[str, Dict[str, float]] = {}
+        self._blocked_by: Dict[str, int] = {}
+        self._starvation_ticks = 0
+        self._drought_ticks = 0
+
+    def record_tick(self, record: dict) -> None:
+        record = dict(record, tick=self._ticks)
+        self._ticks += 1
+        self._records.append(record)
+
+        for phase, seconds in record['phases'].items():
+            self._phase_totals[phase] = self._phase_totals.get(phase, 0.0) + seconds
+            hist = self._phase_hist.get(phase)
+            if hist is None:
+                hist = self._phase_hist[phase] = [0] * (len(self._buckets) + 1)
+            hist[bisect_left(self._buckets, seconds)] += 1
+
+        for kind, stats in record['kinds'].items():
+            totals = self._kind_totals.get(kind)
+            if totals is None:
+                totals = self._kind_totals[kind] = {'seconds': 0.0, 'count': 0, 'stalled': 0}
+            for key, value in stats.items():
+                totals[key] += value
+
+        for resource, count in record['blocked_by'].items():
+            self._blocked_by[resource] = self._blocked_by.get(resource, 0) + count
+        self._starvation_ticks += record['starved']
+        self._drought_ticks += record['drought']
+
+    def records(self) -> List[dict]:
+        return list(self._records)
+
+    def histogram(self) -> Dict[str, List[tuple]]:
+        edges = self._buckets + (float('inf'),)
+        return {phase: list(zip(edges, counts)) for phase, counts in self._phase_hist.items()}
+
+    def summary(self) -> dict:
+        return {
+            'ticks': self._ticks,
+            'phases': dict(self._phase_totals),
+            'kinds': {kind: dict(totals) for kind, totals in self._kind_totals.items()},
+            'blocked_by': dict(self._blocked_by),
+            'starvation_ticks': self._starvation_ticks,
+            'drought_ticks': self._drought_ticks,
+            'histogram': self.histogram(),
+        }
+
+    def reset(self) -> None:
+        self.__init__(self._records.maxlen, self._buckets)
@@ -0,0 +1,199 @@
+from __future__ import annotations
+import argparse
+import json
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from container import Container, build_container
+from services import GameService
+
+MAGIC = b'CITYJRNL'
+JOURNAL_VERSION = 1
+HEADER = struct.Struct('<8sII')
+RECORD = struct.Struct('<I')
+INT = struct.Struct('<q')
+STR_LEN = struct.Struct('<I')
+
+OPCODES = {
+    'build': 1,
+    'upgrade': 2,
+    'research_tech': 3,
+    'trade': 4,
+    'raid': 5,
+    'build_ship': 6,
+    'tick': 7,
+    'advance': 8,
+    'add_resources': 9,
+}
+OPNAMES = {code: name for name, code in OPCODES.items()}
+
+
+class JournalError(Exception):
+    pass
+
+
+def encode_record(op: str, args: tuple) -> bytes:
+    parts = [bytes((OPCODES[op],))]
+    for arg in args:
+        if isinstance(arg, int):
+            parts.append(b'i' + INT.pack(arg))
+        else:
+            data = str(arg).encode('utf-8')
+            parts.append(b's' + STR_LEN.pack(len(data)) + data)
+    payload = b''.join(parts)
+    return RECORD.pack(len(payload)) + payload
+
+
+def decode_record(payload: memoryview) -> Tuple[str, tuple]:
+    op = OPNAMES.get(payload[0])
+    if op is None:
+        raise JournalError(f"Unknown opcode {payload[0]}")
+    args: List = []
+    pos = 1
+    while pos < len(payload):
+        tag = payload[pos:pos + 1]
+        pos += 1
+        if tag == b'i':
+            args.append(INT.unpack_from(payload, pos)[0])
+            pos += INT.size
+        elif tag == b's':
+            n = STR_LEN.unpack_from(payload, pos)[0]
+            pos += STR_LEN.size
+            args.append(bytes(payload[pos:pos + n]).decode('utf-8'))
+            pos += n
+        else:
+            raise JournalError(f"Bad argument tag {bytes(tag)!r}")
+    return op, tuple(args)
+
+
+class Journal:
+    def __init__(self, path: str, seed: int, container_kwargs: Optional[dict] = None):
+        self._file: BinaryIO = open(path, 'wb')
+        header = json.dumps({'seed': seed, 'container': container_kwargs or {}}).encode('utf-8')
+        self._file.write(HEADER.pack(MAGIC, JOURNAL_VERSION, len(header)) + header)
+        self._file.flush()
+
+    def append(self, op: str, *args) -> None:
+        self._file.write(encode_record(op, args))
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_journal(path: str) -> Tuple[dict, Iterator[Tuple[str, tuple]]]:
+    with open(path, 'rb') as f:
+        data = memoryview(f.read())
+    magic, version, header_len = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise JournalError(f"{path} is not a city journal")
+    if version != JOURNAL_VERSION:
+        raise JournalError(f"Unsupported journal version {version} (expected {JOURNAL_VERSION})")
+    header = json.loads(bytes(data[HEADER.size:HEADER.size + header_len]))
+
+    def records() -> Iterator[Tuple[str, tuple]]:
+        pos = HEADER.size + header_len
+        while pos + RECORD.size <= len(data):
+            (length,) = RECORD.unpack_from(data, pos)
+            pos += RECORD.size
+            if pos + length > len(data):
+                # Torn write at the tail of a crashed session.
+                return
+            yield decode_record(data[pos:pos + length])
+            pos += length
+
+    return header, records()
+
+
+class JournalingGameService:
+    def __init__(self, game_service: GameService, journal: Journal):
+        self._inner = game_service
+        self._journal = journal
+
+    def __getattr__(self, name: str):
+        return getattr(self._inner, name)
+
+    def build(self, kind: str) -> tuple[bool, str]:
+        self._journal.append('build', kind)
+        return self._inner.build(kind)
+
+    def upgrade(self, building_id: int) -> tuple[bool, str]:
+        self._journal.append('upgrade', building_id)
+        return self._inner.upgrade(building_id)
+
+    def research_tech(self, tech_name: str) -> tuple[bool, str]:
+        self._journal.append('research_tech', tech_name)
+        return self._inner.research_tech(tech_name)
+
+    def trade(self, city: str, offer_idx: int, generation: Optional[int] = None) -> tuple[bool, str]:
+        self._journal.append('trade', city, offer_idx, *(() if generation is None else (generation,)))
+        return self._inner.trade(city, offer_idx, generation)
+
+    def trade_many(self, trades) -> list:
+        trades = list(trades)
+        for trade in trades:
+            self._journal.append('trade', *trade)
+        return self._inner.trade_many(trades)
+
+    def raid(self) -> tuple[bool, str]:
+        self._journal.append('raid')
+        return self._inner.raid()
+
+    def build_ship(self) -> tuple[bool, str]:
+        self._journal.append('build_ship')
+        return self._inner.build_ship()
+
+    def tick(self) -> None:
+        self._journal.append('tick')
+        self._inner.tick()
+
+    def advance(self, n_ticks: int):
+        self._journal.append('advance', n_ticks)
+        return self._inner.advance(n_ticks)
+
+    def add_resources(self, amounts: Dict[str, int]) -> None:
+        self._journal.append('add_resources', *[x for item in amounts.items() for x in item])
+        self._inner.add_resources(amounts)
+
+
+def apply_record(gs: GameService, op: str, args: tuple):
+    if op == 'add_resources':
+        return gs.add_resources(dict(zip(args[0::2], args[1::2])))
+    if op == 'tick':
+        return gs.advance(1)
+    return getattr(gs, op)(*args)
+
+
+def replay(path: str, **container_kwargs) -> Container:
+    header, records = read_journal(path)
+    c = build_container(seed=header['seed'], **{**header['container'], **container_kwargs})
+    gs = c.resolve('game_service')
+
+    pending_ticks = 0
+    for op, args in records:
+        if op == 'tick':
+            pending_ticks += 1
+            continue
+        if pending_ticks:
+            gs.advance(pending_ticks)
+            pending_ticks = 0
+        apply_record(gs, op, args)
+    if pending_ticks:
+        gs.advance(pending_ticks)
+    return c
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a city journal headlessly")
+    parser.add_argument('journal')
+    parser.add_argument('--vectorized', action='store_true')
+    args = parser.parse_args()
+
+    kwargs = {'vectorized': True} if args.vectorized else {}
+    gs = replay(args.journal, **kwargs).resolve('game_service')
+    for name, amount in gs.list_resources().items():
+        print(f"{name:15} {amount}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional, TextIO
+
+from interfaces import ILogger
+
+
+class LogEvent(NamedTuple):
+    time: float
+    level: int
+    message: str
+    fields: dict
+
+
+def format_event(event: LogEvent) -> str:
+    marker = '[!] ' if event.level >= logging.WARNING else ''
+    return f"  {marker}{event.message}\n"
+
+
+class NullLogger(ILogger):
+    def log(self, msg: str, level: int = logging.INFO, **fields) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class RingBufferLogger(ILogger):
+    # log() only appends to a bounded deque; when it is full the oldest event
+    # is overwritten and counted as dropped. With a stream, a daemon thread
+    # writes the buffer out in batches; without one, events stay buffered
+    # until drain().
+    def __init__(self, capacity: int = 4096, level: int = logging.INFO, stream: Optional[TextIO] = None,
+                 flush_interval: float = 0.25, batch_size: int = 256):
+        self._events: Deque[LogEvent] = deque(maxlen=capacity)
+        self._capacity = capacity
+        self.level = level
+        self._stream = stream
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self.dropped = 0
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def console(cls, **kwargs) -> RingBufferLogger:
+        return cls(stream=sys.stdout, **kwargs)
+
+    def log(self, msg: str, level: int = logging.INFO, **fields) -> None:
+        if level < self.level:
+            return
+        events = self._events
+        if len(events) == self._capacity:
+            self.dropped += 1
+        events.append(LogEvent(time.time(), level, msg, fields))
+        if self._stream is not None:
+            if self._thread is None:
+                self._start()
+            if len(events) >= self._batch_size:
+                self._wake.set()
+
+    def events(self) -> List[LogEvent]:
+        return list(self._events)
+
+    def drain(self) -> List[LogEvent]:
+        events = self._events
+        batch = []
+        while events:
+            try:
+                batch.append(events.popleft())
+            except IndexError:
+                break
+        return batch
+
+    def flush(self) -> None:
+        if self._stream is None:
+            return
+        with self._write_lock:
+            batch = self.drain()
+            if batch:
+                self._stream.write(''.join(format_event(e) for e in batch))
+                self._stream.flush()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _start(self) -> None:
+        with self._write_lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name='ring-buffer-logger', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            self.flush()
@@ -1,13 +1,33 @@
-from container import build_container
-from ui import ConsoleUI
-
-
-def main():
-    c = build_container()
-    gs = c.resolve('game_service')
-    ui = ConsoleUI(gs)
-    ui.main_loop()
-
-
-if __name__ == '__main__':
-    main()
+import argparse
+import random
+
+from container import build_container
+from journal import Journal, JournalingGameService
+from logger import RingBufferLogger
+from ui import ConsoleUI
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Advanced city builder")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--journal', help="record every action to this file for replay")
+    args = parser.parse_args()
+
+    seed = args.seed
+    if args.journal and seed is None:
+        seed = random.SystemRandom().randrange(2 ** 63)
+
+    logger = RingBufferLogger.console()
+    c = build_container(seed=seed, logger=logger)
+    gs = c.resolve('game_service')
+    if args.journal:
+        gs = JournalingGameService(gs, Journal(args.journal, seed))
+    ui = ConsoleUI(gs, logger)
+    try:
+        ui.main_loop()
+    finally:
+        logger.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,441 @@
+from __future__ import annotations
+import argparse
+import heapq
+import json
+import multiprocessing
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from batch import Action, apply_action
+from container import Container, build_container
+from entities import ProducerBuilding
+from services import ConstructionService, GameService, fire_stack, flow_order
+
+MAX_LEVEL = 10
+
+
+@dataclass
+class Goal:
+    stock: Dict[str, int] = field(default_factory=dict)
+    rate: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class Plan:
+    found: bool
+    ticks: int
+    actions: List[Action]
+    expanded: int
+
+
+class PlanState(tuple):
+    # (amounts, capacities, buildings, techs) with the hash computed once; the
+    # transposition table and the beam hash every state many times.
+    __slots__ = ()
+
+    def __new__(cls, amounts: tuple, caps: tuple, buildings: tuple, techs: int):
+        state = super().__new__(cls, (amounts, caps, buildings, techs, hash((amounts, caps, buildings, techs))))
+        return state
+
+    def __hash__(self) -> int:
+        return self[4]
+
+    def __eq__(self, other) -> bool:
+        return self[4] == other[4] and self[:4] == other[:4]
+
+    def __ne__(self, other) -> bool:
+        return not self == other
+
+    def __reduce__(self):
+        return PlanState, self[:4]
+
+
+class CityModel:
+    # A side-effect-free copy of the rules in ProductionService,
+    # ConstructionService, ResearchService and GameService, flattened into
+    # resource-id tuples so states can be stepped without touching a container.
+    def __init__(self, c: Container, max_level: int = MAX_LEVEL):
+        rm = c.resolve('resource_manager')
+        catalog = c.resolve('building_catalog')
+        research = c.resolve('research_service')
+        names = tuple(rm._repo.names)
+        rid = {name: i for i, name in enumerate(names)}
+
+        def ids(mapping) -> tuple:
+            return tuple((rid[r], amount) for r, amount in mapping.items() if r in rid)
+
+        self.names = names
+        self.people, self.food, self.water = rid['people'], rid['food'], rid['water']
+        self.ship = rid['ship']
+        self.research_points = rid['research_points']
+        self.build_crew = 2
+
+        self.kinds = tuple(spec.kind for spec in catalog)
+        kind_index = {kind: i for i, kind in enumerate(self.kinds)}
+        self.kind_index = kind_index
+        self.build_costs = tuple(ids(spec.cost) for spec in catalog)
+        self.is_producer = tuple(issubclass(spec.cls, ProducerBuilding) for spec in catalog)
+        self.port = kind_index.get('port')
+        self.ship_cost = ids(GameService.ship_cost)
+        self.upgrade_costs = tuple(ids(ConstructionService.upgrade_cost(level)) for level in range(max_level + 1))
+        self.max_level = max_level
+
+        # rates[kind][level] -> (consumes or None, produces, adds_capacity, overlap)
+        self.rates: List[tuple] = []
+        for spec in catalog:
+            levels = [None]
+            for level in range(1, max_level + 1):
+                table = spec.rates.at_level(level) if spec.rates is not None else None
+                if table is None:
+                    levels.append(((), (), (), False))
+                    continue
+                consumes = None if any(r not in rid for r in table.consumes) else ids(table.consumes)
+                caps = ids(table.adds_capacity) if hasattr(spec.cls, 'adds_capacity') else ()
+                produces = ids(table.produces)
+                overlap = consumes is not None and bool({r for r, _ in consumes} & {r for r, _ in produces})
+                levels.append((consumes, produces, caps, overlap))
+            self.rates.append(tuple(levels))
+
+        tree = research.tech_tree
+        self.techs = tuple(tree)
+        tech_bit = {name: 1 << i for i, name in enumerate(self.techs)}
+        self.tech_costs = tuple(tree[name]['cost'] for name in self.techs)
+        self.tech_requires = tuple(sum(tech_bit[r] for r in tree[name]['requires']) for name in self.techs)
+        self.kind_tech = tuple(tech_bit[spec.tech] if spec.tech else 0 for spec in catalog)
+
+        self.flow_nodes = tuple(
+            (tuple(r for r, _ in levels[1][0] or ()), tuple(r for r, _ in levels[1][1])) for levels in self.rates
+        )
+        self._orders: Dict[tuple, tuple] = {}
+
+        repo = c.resolve('building_repo')
+        self.existing_ids = tuple(b.id for b in repo)
+        self.next_id = c.resolve('building_factory').snapshot_state() + 1
+        self.initial = PlanState(
+            tuple(rm.amounts), tuple(rm.capacities),
+            tuple((kind_index[b.kind], b.level) for b in repo),
+            sum(tech_bit[name] for name in research.snapshot_state()),
+        )
+
+    def building_id(self, index: int) -> int:
+        if index < len(self.existing_ids):
+            return self.existing_ids[index]
+        return self.next_id + index - len(self.existing_ids)
+
+    def producer_order(self, buildings: tuple) -> tuple:
+        # (kind, level, count) stacks in the same upstream-first order as
+        # ProductionService._production_order.
+        order = self._orders.get(buildings)
+        if order is None:
+            kinds: Dict[int, int] = {}
+            counts: Dict[tuple, int] = {}
+            for kind, level in buildings:
+                if self.is_producer[kind]:
+                    kinds.setdefault(kind, len(kinds))
+                    counts[kind, level] = counts.get((kind, level), 0) + 1
+            ranks, batches = flow_order([self.flow_nodes[kind] for kind in kinds])
+
+            def key(stack: tuple) -> tuple:
+                node = kinds[stack[0]]
+                return batches[node], ranks[node], node, stack[1]
+
+            order = self._orders[buildings] = tuple(
+                (kind, level, counts[kind, level]) for kind, level in sorted(counts, key=key))
+        return order
+
+    def tick(self, state: PlanState) -> Tuple[PlanState, tuple]:
+        amounts, caps, buildings, techs = state[:4]
+        a = list(amounts)
+        produced = [0] * len(a)
+
+        people = a[self.people]
+        if people > 0:
+            food_needed = max(1, int(people * 0.2))
+            if a[self.food] >= food_needed:
+                a[self.food] -= food_needed
+            elif a[self.people] >= max(1, int(people * 0.1)):
+                a[self.people] -= max(1, int(people * 0.1))
+        if buildings:
+            if a[self.water] >= len(buildings):
+                a[self.water] -= len(buildings)
+            elif people > 0 and a[self.people] >= 1:
+                a[self.people] -= 1
+
+        rates = self.rates
+        for kind, level, count in self.producer_order(buildings):
+            consumes, produces, _, overlap = rates[kind][level]
+            if consumes is None:
+                continue
+            fired = fire_stack(a, caps, consumes, produces, count, overlap)
+            for r, amount in produces:
+                produced[r] += amount * fired
+        return PlanState(tuple(a), caps, buildings, techs), tuple(produced)
+
+    def actions(self, state: PlanState, kinds: Sequence[int], ships: bool) -> Iterable[Tuple[Action, PlanState]]:
+        amounts, caps, buildings, techs = state[:4]
+
+        for t, name in enumerate(self.techs):
+            bit = 1 << t
+            if techs & bit or self.tech_requires[t] & ~techs:
+                continue
+            cost = self.tech_costs[t]
+            if amounts[self.research_points] >= cost:
+                a = list(amounts)
+                a[self.research_points] -= cost
+                yield ('research', name), PlanState(tuple(a), caps, buildings, techs | bit)
+
+        if amounts[self.people] >= self.build_crew:
+            for kind in kinds:
+                if self.kind_tech[kind] & ~techs:
+                    continue
+                a = _pay(amounts, self.build_costs[kind])
+                if a is None:
+                    continue
+                new_caps = _grow(caps, self.rates[kind][1][2])
+                yield ('build', self.kinds[kind]), PlanState(tuple(a), new_caps, buildings + ((kind, 1),), techs)
+
+        # Upgrading any one of several identical buildings leads to equivalent
+        # states, so only the first of each (kind, level) is tried.
+        seen = set()
+        for index, (kind, level) in enumerate(buildings):
+            if level >= self.max_level or (kind, level) in seen:
+                continue
+            seen.add((kind, level))
+            a = _pay(amounts, self.upgrade_costs[level])
+            if a is None:
+                continue
+            old_caps, new_caps = self.rates[kind][level][2], self.rates[kind][level + 1][2]
+            delta = dict(new_caps)
+            for r, amount in old_caps:
+                delta[r] = delta.get(r, 0) - amount
+            upgraded = buildings[:index] + ((kind, level + 1),) + buildings[index + 1:]
+            yield ('upgrade', self.building_id(index)), PlanState(tuple(a), _grow(caps, delta.items()), upgraded, techs)
+
+        if ships and self.port is not None and any(kind == self.port for kind, _ in buildings):
+            a = _pay(amounts, self.ship_cost)
+            if a is not None:
+                a[self.ship] = min(a[self.ship] + 1, caps[self.ship])
+                yield ('ship',), PlanState(tuple(a), caps, buildings, techs)
+
+
+def _pay(amounts: tuple, costs: tuple) -> Optional[list]:
+    for r, amount in costs:
+        if amounts[r] < amount:
+            return None
+    a = list(amounts)
+    for r, amount in costs:
+        a[r] -= amount
+    return a
+
+
+def _grow(caps: tuple, increases) -> tuple:
+    if not increases:
+        return caps
+    c = list(caps)
+    for r, amount in increases:
+        c[r] += amount
+    return tuple(c)
+
+
+class Scorer:
+    def __init__(self, model: CityModel, goal: Goal):
+        rid = {name: i for i, name in enumerate(model.names)}
+        self.stock = tuple((rid[r], target) for r, target in goal.stock.items())
+        self.rate = tuple((rid[r], target) for r, target in goal.rate.items())
+
+        # Resources the goal depends on: the targets, the ship recipe when ships
+        # are wanted, and everything consumed along the way to producing them.
+        needed = {r for r, _ in self.stock + self.rate}
+        self.ships = model.ship in needed
+        if self.ships:
+            needed.update(r for r, _ in model.ship_cost)
+        relevant_kinds = set()
+        if self.ships and model.port is not None:
+            relevant_kinds.add(model.port)
+        changed = True
+        while changed:
+            changed = False
+            for kind, levels in enumerate(model.rates):
+                consumes, produces = levels[1][:2]
+                if consumes is None or not any(r in needed for r, _ in produces):
+                    continue
+                relevant_kinds.add(kind)
+                for r, _ in consumes:
+                    if r not in needed:
+                        needed.add(r)
+                        changed = True
+        self.needed = tuple(sorted(needed))
+        self.relevant_kinds = frozenset(relevant_kinds)
+
+        tech_mask = 0
+        for kind in relevant_kinds:
+            tech_mask |= model.kind_tech[kind]
+        closure = 0
+        while closure != tech_mask:
+            closure = tech_mask
+            for t in range(len(model.techs)):
+                if tech_mask & (1 << t):
+                    tech_mask |= model.tech_requires[t]
+        self.relevant_techs = tech_mask
+
+    def reached(self, state: PlanState, produced: tuple) -> bool:
+        amounts = state[0]
+        return (all(amounts[r] >= target for r, target in self.stock)
+                and all(produced[r] >= target for r, target in self.rate))
+
+    def score(self, state: PlanState, produced: tuple) -> float:
+        amounts, caps, buildings, techs = state[:4]
+        targets = self.stock + self.rate
+        progress = sum(min(1.0, amounts[r] / target) for r, target in self.stock)
+        progress += sum(min(1.0, produced[r] / target) for r, target in self.rate)
+        progress /= max(1, len(targets))
+
+        techs_done = bin(techs & self.relevant_techs).count('1') / max(1, bin(self.relevant_techs).count('1'))
+        kinds_built = len({kind for kind, _ in buildings} & self.relevant_kinds) / max(1, len(self.relevant_kinds))
+        flow = sum(min(1.0, produced[r] / 10) for r in self.needed) / max(1, len(self.needed))
+        stock = sum(amounts[r] / max(1, caps[r]) for r in self.needed) / max(1, len(self.needed))
+        return 1000 * progress + 50 * techs_done + 20 * kinds_built + 10 * flow + stock
+
+
+_worker: Optional[tuple] = None
+
+
+def _init_worker(model: CityModel, scorer: Scorer, kinds: tuple) -> None:
+    global _worker
+    _worker = (model, scorer, kinds)
+
+
+def _expand(states: Sequence[PlanState]) -> List[List[tuple]]:
+    model, scorer, kinds = _worker
+    out = []
+    for state in states:
+        successors = []
+        candidates = [(None, state)]
+        candidates.extend(model.actions(state, kinds, scorer.ships))
+        for action, before in candidates:
+            after, produced = model.tick(before)
+            successors.append((action, after, scorer.reached(after, produced), scorer.score(after, produced)))
+        out.append(successors)
+    return out
+
+
+def _chunks(items: Sequence, n: int) -> List[Sequence]:
+    size = max(1, -(-len(items) // n))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def plan(c: Container, goal: Goal, beam_width: int = 64, max_ticks: int = 300,
+         workers: Optional[int] = 1) -> Plan:
+    model = CityModel(c)
+    scorer = Scorer(model, goal)
+    kinds = tuple(range(len(model.kinds)))
+    args = (model, scorer, kinds)
+
+    # Every node is (state, parent node, action taken before its tick).
+    if not goal.rate and scorer.reached(model.initial, ()):
+        return Plan(True, 0, [], 0)
+    beam = [(model.initial, None, None)]
+    table = {model.initial: 0}
+    expanded = 0
+
+    pool = multiprocessing.Pool(workers, _init_worker, args) if workers != 1 else None
+    n_chunks = 4 * (workers or os.cpu_count() or 1)
+    if pool is None:
+        _init_worker(*args)
+    try:
+        for t in range(1, max_ticks + 1):
+            states = [node[0] for node in beam]
+            if pool is None:
+                results = _expand(states)
+            else:
+                results = [r for part in pool.map(_expand, _chunks(states, n_chunks)) for r in part]
+            expanded += len(states)
+
+            layer = []
+            for node, successors in zip(beam, results):
+                for action, state, reached, score in successors:
+                    if reached:
+                        actions = _actions((state, node, action))
+                        return Plan(True, _ticks(actions), actions, expanded)
+                    if state in table:
+                        continue
+                    table[state] = t
+                    layer.append((score, len(layer), (state, node, action)))
+            if not layer:
+                break
+            beam = [entry[2] for entry in heapq.nlargest(beam_width, layer)]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    actions = _actions(beam[0])
+    return Plan(False, _ticks(actions), actions, expanded)
+
+
+def _actions(node: tuple) -> List[Action]:
+    steps = []
+    while node[1] is not None:
+        steps.append(node[2])
+        node = node[1]
+    steps.reverse()
+
+    actions: List[Action] = []
+    for step in steps:
+        if step is not None:
+            actions.append(step)
+        if actions and actions[-1][0] == 'tick':
+            actions[-1] = ('tick', actions[-1][1] + 1)
+        else:
+            actions.append(('tick', 1))
+    return actions
+
+
+def _ticks(actions: Sequence[Action]) -> int:
+    return sum(action[1] for action in actions if action[0] == 'tick')
+
+
+def execute_plan(gs: GameService, actions: Iterable[Action]) -> List[bool]:
+    return [apply_action(gs, action)[0] for action in actions]
+
+
+def _targets(pairs: Sequence[str]) -> Dict[str, int]:
+    targets = {}
+    for pair in pairs:
+        name, _, value = pair.partition('=')
+        targets[name] = int(value)
+    return targets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search for a build order that reaches a target economy")
+    parser.add_argument('--stock', nargs='*', default=[], metavar='RES=N', help="hold at least N of a resource")
+    parser.add_argument('--rate', nargs='*', default=[], metavar='RES=N', help="produce at least N of a resource per tick")
+    parser.add_argument('--beam', type=int, default=64)
+    parser.add_argument('--max-ticks', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=1)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--snapshot', help="plan from a saved city snapshot")
+    source.add_argument('--journal', help="plan from the end of a replayed journal")
+    args = parser.parse_args()
+
+    goal = Goal(_targets(args.stock), _targets(args.rate))
+    if not goal.stock and not goal.rate:
+        parser.error("give at least one --stock or --rate target")
+    if args.snapshot:
+        from snapshot import load_snapshot
+        c = load_snapshot(args.snapshot)
+    elif args.journal:
+        from journal import replay
+        c = replay(args.journal)
+    else:
+        c = build_container()
+    result = plan(c, goal, args.beam, args.max_ticks, args.workers)
+    status = "reached" if result.found else "not reached"
+    print(f"# goal {status} after {result.ticks} ticks ({result.expanded} states expanded)")
+    print(json.dumps(result.actions))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,507 @@
-from __future__ import annotations
-from typing import Dict, List, Optional
-
-from interfaces import IRepository
-from entities import Building, Resource
-
-
-class BuildingRepository(IRepository):
-    def __init__(self):
-        self._store: List[Building] = []
-
-    def all(self) -> List[Building]:
-        return list(self._store)
-
-    def add(self, item: Building) -> None:
-        self._store.append(item)
-
-
-class ResourceRepository(IRepository):
-    def __init__(self):
-        self._store: Dict[str, Resource] = {}
-
-    def all(self) -> List[Resource]:
-        return list(self._store.values())
-
-    def add(self, item: Resource) -> None:
-        self._store[item.name] = item
-
-    def get(self, name: str) -> Optional[Resource]:
-        return self._store.get(name)
\ No newline at end of file
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from interfaces import IRepository
+from entities import (
+    Building, BuildingStack, ProducerBuilding, ProducerStorageBuilding, StorageBuilding, WaterTower, RateTable, Resource
+)
+
+
+class BuildingRepository(IRepository):
+    # After fork() the buildings that existed at fork time sit in a frozen base
+    # repository shared by both sides. Each side keeps its own additions and, in
+    # _by_id, private copies of the base buildings it has upgraded since.
+    # Producers are also counted per (kind, level) stack; stacks are few, so
+    # every side keeps its own copy.
+    max_depth = 16
+
+    def __init__(self, base: Optional[BuildingRepository] = None):
+        self._store: List[Building] = []
+        self._by_id: Dict[int, Building] = {}
+        self._by_kind: Dict[str, List[Building]] = {}
+        self._producers: List[ProducerBuilding] = []
+        self._base = base
+        self._base_len = len(base) if base is not None else 0
+        self._depth = base._depth + 1 if base is not None else 0
+        self._version = base._version if base is not None else 0
+        self._merged_version = -1
+        self._merged_producers: List[ProducerBuilding] = []
+        self._stacks: Dict[RateTable, BuildingStack] = (
+            {rates: stack.copy() for rates, stack in base._stacks.items()} if base is not None else {})
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def all(self) -> List[Building]:
+        if self._base is None:
+            return list(self._store)
+        return list(self)
+
+    def add(self, item: Building) -> None:
+        self._store.append(item)
+        self._by_id[item.id] = item
+        self._by_kind.setdefault(item.kind, []).append(item)
+        if isinstance(item, ProducerBuilding):
+            self._producers.append(item)
+            _stack_of(self._stacks, item.kind, item.rates).count += 1
+        self._version += 1
+
+    def get(self, building_id: int) -> Optional[Building]:
+        b = self._by_id.get(building_id)
+        if b is None and self._base is not None:
+            return self._base.get(building_id)
+        return b
+
+    def upgrade(self, building_id: int) -> Optional[Building]:
+        b = self._by_id.get(building_id)
+        if b is None and self._base is not None:
+            shared = self._base.get(building_id)
+            if shared is None:
+                return None
+            b = self._by_id[building_id] = shared.copy()
+        if b is None:
+            return None
+        _upgrade_stacked(self._stacks, b)
+        self._version += 1
+        return b
+
+    def fork(self) -> BuildingRepository:
+        if self._base is None or self._store or self._by_id:
+            self._freeze()
+        child = type(self).__new__(type(self))
+        BuildingRepository.__init__(child, self._base)
+        return child
+
+    def _freeze(self) -> None:
+        if self._depth >= self.max_depth:
+            frozen = BuildingRepository()
+            for b in self:
+                frozen.add(b)
+            frozen._version = self._version
+        else:
+            frozen = BuildingRepository.__new__(BuildingRepository)
+            frozen.__dict__.update(self.__dict__)
+        BuildingRepository.__init__(self, frozen)
+
+    def _resolve(self, b: Building) -> Building:
+        return self._by_id.get(b.id, b)
+
+    def by_kind(self, kind: str) -> Sequence[Building]:
+        local = self._by_kind.get(kind, ())
+        if self._base is None:
+            return local
+        return [self._resolve(b) for b in self._base.by_kind(kind)] + list(local)
+
+    def has_kind(self, kind: str) -> bool:
+        return bool(self._by_kind.get(kind)) or (self._base is not None and self._base.has_kind(kind))
+
+    def stacks(self) -> Sequence[BuildingStack]:
+        return list(self._stacks.values())
+
+    def producers(self) -> Sequence[ProducerBuilding]:
+        if self._base is None:
+            return self._producers
+        if self._merged_version != self._version:
+            self._merged_producers = [self._resolve(b) for b in self._base.producers()] + self._producers
+            self._merged_version = self._version
+        return self._merged_producers
+
+    def __iter__(self) -> Iterator[Building]:
+        if self._base is None:
+            return iter(self._store)
+        return chain((self._resolve(b) for b in self._base), self._store)
+
+    def __len__(self) -> int:
+        return self._base_len + len(self._store)
+
+
+def _stack_of(stacks: Dict[RateTable, BuildingStack], kind: str, rates: RateTable) -> BuildingStack:
+    stack = stacks.get(rates)
+    if stack is None:
+        stack = stacks[rates] = BuildingStack(kind, rates)
+    return stack
+
+
+def _upgrade_stacked(stacks: Optional[Dict[RateTable, BuildingStack]], b: Building) -> None:
+    # Moves one unit from the building's current stack to the next level's.
+    if stacks is None or not isinstance(b, ProducerBuilding):
+        b.upgrade()
+        return
+    stacks[b.rates].count -= 1
+    b.upgrade()
+    _stack_of(stacks, b.kind, b.rates).count += 1
+
+
+class _ColumnView:
+    # Mixin that redirects the entity fields of a building class to one row
+    # of a CompactBuildingRepository. Concrete views declare the slots.
+    __slots__ = ()
+
+    @property
+    def _id(self) -> int:
+        return self._repo._id_at(self._row)
+
+    @property
+    def _kind(self) -> str:
+        return self._repo._kind_names[self._repo._code_at(self._row)]
+
+    @property
+    def _level(self) -> int:
+        return self._repo._level_at(self._row)
+
+    @property
+    def _rates(self) -> Optional[RateTable]:
+        repo = self._repo
+        rates = repo._kind_rates[repo._code_at(self._row)]
+        return rates.at_level(repo._level_at(self._row)) if rates is not None else None
+
+    def upgrade(self) -> None:
+        self._repo._set_level(self._row, self._repo._level_at(self._row) + 1)
+
+
+class BuildingView(_ColumnView, Building):
+    __slots__ = ('_repo', '_row')
+
+    def __init__(self, repo: CompactBuildingRepository, row: int):
+        self._repo = repo
+        self._row = row
+
+
+class ProducerView(_ColumnView, ProducerBuilding):
+    __slots__ = ('_repo', '_row')
+    __init__ = BuildingView.__init__
+
+
+class StorageView(_ColumnView, StorageBuilding):
+    __slots__ = ('_repo', '_row')
+    __init__ = BuildingView.__init__
+
+
+class ProducerStorageView(_ColumnView, ProducerStorageBuilding):
+    __slots__ = ('_repo', '_row')
+    __init__ = BuildingView.__init__
+
+
+class WaterTowerView(_ColumnView, WaterTower):
+    __slots__ = ('_repo', '_row')
+    __init__ = BuildingView.__init__
+
+
+def _growable(typecode: str, column) -> array:
+    if isinstance(column, array):
+        return column
+    result = array(typecode)
+    result.frombytes(memoryview(column).cast('B'))
+    return result
+
+
+_VIEW_CLASSES = [
+    (WaterTower, WaterTowerView),
+    (ProducerStorageBuilding, ProducerStorageView),
+    (ProducerBuilding, ProducerView),
+    (StorageBuilding, StorageView),
+    (Building, BuildingView),
+]
+
+
+class CompactBuildingRepository(BuildingRepository):
+    # Columnar storage for very large cities: one row per building in
+    # id/kind-code/level arrays, handed out as short-lived views. As with
+    # BuildingRepository, fork() freezes the rows that exist into a base both
+    # sides share; each side keeps its own appended rows and, in
+    # _base_levels, the levels of base rows it has upgraded since.
+    max_depth = 16
+
+    def __init__(self, base: Optional[CompactBuildingRepository] = None):
+        self._ids = array('q')
+        self._kind_codes = array('H')
+        self._levels = array('H')
+        self._producer_rows = array('q')
+        self._row_by_id: Optional[Dict[int, int]] = None
+        self._base = base
+        self._base_levels: Dict[int, int] = {}
+        if base is None:
+            self._base_len = 0
+            self._depth = 0
+            self._kind_names: List[str] = []
+            self._kind_views: List[type] = []
+            self._kind_rates: List[Optional[RateTable]] = []
+            self._kind_lookup: Dict[str, int] = {}
+            self._kind_rows: List[array] = []
+            self._ids_sorted = True
+            self._stacks: Optional[Dict[RateTable, BuildingStack]] = {}
+            self._version = 0
+        else:
+            self._base_len = len(base)
+            self._depth = base._depth + 1
+            self._kind_names = list(base._kind_names)
+            self._kind_views = list(base._kind_views)
+            self._kind_rates = list(base._kind_rates)
+            self._kind_lookup = dict(base._kind_lookup)
+            self._kind_rows = [array('q') for _ in base._kind_names]
+            self._ids_sorted = base._ids_sorted
+            self._stacks = ({rates: stack.copy() for rates, stack in base._stacks.items()}
+                            if base._stacks is not None else None)
+            self._version = base._version
+
+    def load_columns(self, prototypes: Sequence[Building], ids, kind_codes, levels,
+                     kind_rows: Sequence, producer_rows, ids_sorted: bool) -> None:
+        # Columns may be any buffer (e.g. a memory-mapped snapshot); they are
+        # copied into growable arrays only when the first building is added.
+        # The version keeps counting up so services synced before still resync.
+        version = self._version
+        CompactBuildingRepository.__init__(self)
+        for proto in prototypes:
+            self._kind_code(proto)
+        self._ids = ids
+        self._kind_codes = kind_codes
+        self._levels = levels
+        self._kind_rows = list(kind_rows)
+        self._producer_rows = producer_rows
+        self._ids_sorted = ids_sorted
+        self._stacks = None
+        self._version = version + 1
+
+    def columns(self) -> tuple:
+        if self._base is None:
+            return (self._ids, self._kind_codes, self._levels, self._kind_rows, self._producer_rows,
+                    self._ids_sorted)
+        rows = range(len(self))
+        kind_rows = [array('q') for _ in self._kind_names]
+        for code in range(len(self._kind_names)):
+            kind_rows[code].extend(self._rows_of_kind(code))
+        return (array('q', map(self._id_at, rows)), array('H', map(self._code_at, rows)),
+                array('H', map(self._level_at, rows)), kind_rows, array('q', self._all_producer_rows()),
+                self._ids_sorted)
+
+    def fork(self) -> CompactBuildingRepository:
+        if self._base is None or len(self._ids) or self._base_levels:
+            self._freeze()
+        child = CompactBuildingRepository.__new__(CompactBuildingRepository)
+        CompactBuildingRepository.__init__(child, self._base)
+        return child
+
+    def _freeze(self) -> None:
+        if self._depth >= self.max_depth:
+            frozen = CompactBuildingRepository()
+            frozen.load_columns([], *self.columns())
+            frozen._kind_names = self._kind_names
+            frozen._kind_views = self._kind_views
+            frozen._kind_rates = self._kind_rates
+            frozen._kind_lookup = self._kind_lookup
+            frozen._stacks = self._stacks
+            frozen._version = self._version
+        else:
+            frozen = CompactBuildingRepository.__new__(CompactBuildingRepository)
+            frozen.__dict__.update(self.__dict__)
+        CompactBuildingRepository.__init__(self, frozen)
+
+    def _id_at(self, row: int) -> int:
+        if row >= self._base_len:
+            return self._ids[row - self._base_len]
+        return self._base._id_at(row)
+
+    def _code_at(self, row: int) -> int:
+        if row >= self._base_len:
+            return self._kind_codes[row - self._base_len]
+        return self._base._code_at(row)
+
+    def _level_at(self, row: int) -> int:
+        if row >= self._base_len:
+            return self._levels[row - self._base_len]
+        level = self._base_levels.get(row)
+        return level if level is not None else self._base._level_at(row)
+
+    def _set_level(self, row: int, level: int) -> None:
+        if row >= self._base_len:
+            self._levels[row - self._base_len] = level
+        else:
+            self._base_levels[row] = level
+
+    def _rows_of_kind(self, code: int) -> Iterator[int]:
+        own = self._kind_rows[code]
+        if self._base is None or code >= len(self._base._kind_names):
+            return iter(own)
+        return chain(self._base._rows_of_kind(code), own)
+
+    def _all_producer_rows(self) -> Iterator[int]:
+        if self._base is None:
+            return iter(self._producer_rows)
+        return chain(self._base._all_producer_rows(), self._producer_rows)
+
+    def _thaw(self) -> None:
+        if isinstance(self._ids, array):
+            return
+        self._ids = _growable('q', self._ids)
+        self._kind_codes = _growable('H', self._kind_codes)
+        self._levels = _growable('H', self._levels)
+        self._kind_rows = [_growable('q', rows) for rows in self._kind_rows]
+        self._producer_rows = _growable('q', self._producer_rows)
+
+    def _kind_code(self, item: Building) -> int:
+        code = self._kind_lookup.get(item.kind)
+        if code is None:
+            code = self._kind_lookup[item.kind] = len(self._kind_names)
+            self._kind_names.append(item.kind)
+            self._kind_views.append(next(view for cls, view in _VIEW_CLASSES if isinstance(item, cls)))
+            self._kind_rates.append(item._rates.base if item._rates is not None else None)
+            self._kind_rows.append(array('q'))
+        return code
+
+    def _view(self, row: int) -> Building:
+        return self._kind_views[self._code_at(row)](self, row)
+
+    def all(self) -> List[Building]:
+        return [self._view(row) for row in range(len(self))]
+
+    def add(self, item: Building) -> None:
+        self._thaw()
+        row = len(self)
+        code = self._kind_code(item)
+        if row and item.id <= self._id_at(row - 1):
+            self._ids_sorted = False
+        self._ids.append(item.id)
+        self._kind_codes.append(code)
+        self._levels.append(item.level)
+        self._kind_rows[code].append(row)
+        if isinstance(item, ProducerBuilding):
+            self._producer_rows.append(row)
+            if self._stacks is not None:
+                _stack_of(self._stacks, item.kind, item.rates).count += 1
+        if self._row_by_id is not None:
+            self._row_by_id[item.id] = row
+        self._version += 1
+
+    def upgrade(self, building_id: int) -> Optional[Building]:
+        b = self.get(building_id)
+        if b is None:
+            return None
+        _upgrade_stacked(self._stacks, b)
+        self._version += 1
+        return b
+
+    def _row_of(self, building_id: int) -> Optional[int]:
+        ids = self._ids
+        if self._ids_sorted:
+            if self._base is not None and (not ids or building_id < ids[0]):
+                return self._base._row_of(building_id)
+            i = bisect_left(ids, building_id)
+            return self._base_len + i if i < len(ids) and ids[i] == building_id else None
+        if self._row_by_id is None:
+            self._row_by_id = {bid: self._base_len + i for i, bid in enumerate(ids)}
+        row = self._row_by_id.get(building_id)
+        if row is None and self._base is not None:
+            return self._base._row_of(building_id)
+        return row
+
+    def get(self, building_id: int) -> Optional[Building]:
+        row = self._row_of(building_id)
+        return self._view(row) if row is not None else None
+
+    def by_kind(self, kind: str) -> Sequence[Building]:
+        code = self._kind_lookup.get(kind)
+        if code is None:
+            return ()
+        return [self._view(row) for row in self._rows_of_kind(code)]
+
+    def has_kind(self, kind: str) -> bool:
+        code = self._kind_lookup.get(kind)
+        if code is None:
+            return False
+        return len(self._kind_rows[code]) > 0 or (
+            self._base is not None and code < len(self._base._kind_names) and self._base.has_kind(kind))
+
+    def stacks(self) -> Sequence[BuildingStack]:
+        if self._stacks is None:
+            # Columns loaded from a snapshot are counted once, on first use.
+            stacks: Dict[RateTable, BuildingStack] = {}
+            for row in self._all_producer_rows():
+                code = self._code_at(row)
+                _stack_of(stacks, self._kind_names[code], self._kind_rates[code].at_level(self._level_at(row))).count += 1
+            self._stacks = stacks
+        return list(self._stacks.values())
+
+    def producers(self) -> Sequence[ProducerBuilding]:
+        return [self._view(row) for row in self._all_producer_rows()]
+
+    def __iter__(self) -> Iterator[Building]:
+        return (self._view(row) for row in range(len(self)))
+
+    def __len__(self) -> int:
+        return self._base_len + len(self._ids)
+
+
+class ResourceView(Resource):
+    __slots__ = ('_repo', '_rid')
+
+    def __init__(self, repo: ResourceRepository, rid: int):
+        self._repo = repo
+        self._rid = rid
+
+    @property
+    def _name(self) -> str:
+        return self._repo._names[self._rid]
+
+    @property
+    def _amount(self) -> int:
+        return self._repo._amounts[self._rid]
+
+    @_amount.setter
+    def _amount(self, value: int) -> None:
+        self._repo._amounts[self._rid] = value
+
+
+class ResourceRepository(IRepository):
+    # Resource names are interned to dense integer ids; amounts and
+    # capacities live in two parallel lists indexed by id.
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._amounts: List[int] = []
+        self._capacities: List[int] = []
+
+    @property
+    def names(self) -> Sequence[str]:
+        return self._names
+
+    @property
+    def amounts(self) -> List[int]:
+        return self._amounts
+
+    @property
+    def capacities(self) -> List[int]:
+        return self._capacities
+
+    def intern(self, name: str) -> int:
+        rid = self._ids.get(name)
+        if rid is None:
+            rid = self._ids[name] = len(self._names)
+            self._names.append(name)
+            self._amounts.append(0)
+            self._capacities.append(0)
+        return rid
+
+    def id_of(self, name: str) -> Optional[int]:
+        return self._ids.get(name)
+
+    def all(self) -> List[Resource]:
+        return [ResourceView(self, rid) for rid in range(len(self._names))]
+
+    def add(self, item: Resource) -> None:
+        self._amounts[self.intern(item.name)] = item.amount
+
+    def fork(self) -> ResourceRepository:
+        child = ResourceRepository()
+        child._ids = dict(self._ids)
+        child._names = list(self._names)
+        child._amounts = list(self._amounts)
+        child._capacities = list(self._capacities)
+        return child
+
+    def get(self, name: str) -> Optional[Resource]:
+        rid = self._ids.get(name)
+        return ResourceView(self, rid) if rid is not None else None
@@ -0,0 +1,158 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+from dataclasses import asdict
+from typing import Callable, Dict, Optional
+
+from container import build_root, city_scope
+from logger import NullLogger
+from services import GameService
+
+
+# Upper bounds on the work one request can ask for, so a single client can
+# not hold the event loop that every other session shares.
+MAX_ADVANCE_TICKS = 10_000
+MAX_RAID_SAMPLES = 100_000
+MAX_LINE_BYTES = 1 << 20
+
+
+def _bounded(name: str, value, limit: int) -> int:
+    value = int(value)
+    if not 0 <= value <= limit:
+        raise ValueError(f"{name} must be between 0 and {limit}")
+    return value
+
+
+def _buildings(gs: GameService) -> list:
+    return [{'id': b.id, 'kind': b.kind, 'level': b.level, 'summary': b.summary()} for b in gs.list_buildings()]
+
+
+METHODS: Dict[str, Callable] = {
+    'list_resources': GameService.list_resources,
+    'list_buildings': _buildings,
+    'get_building_catalog': GameService.get_building_catalog,
+    'list_research': GameService.list_research,
+    'research_tech': GameService.research_tech,
+    'build': GameService.build,
+    'build_ship': GameService.build_ship,
+    'upgrade': GameService.upgrade,
+    'tick': lambda gs: asdict(gs.advance(1)),
+    'advance': lambda gs, n_ticks: asdict(gs.advance(_bounded('n_ticks', n_ticks, MAX_ADVANCE_TICKS))),
+    'get_trading_cities': GameService.get_trading_cities,
+    'get_city_offers': GameService.get_city_offers,
+    'trade': GameService.trade,
+    'trade_many': GameService.trade_many,
+    'raid': GameService.raid,
+    'estimate_raid': lambda gs, samples=MAX_RAID_SAMPLES, seed=None: asdict(
+        gs.estimate_raid(_bounded('samples', samples, MAX_RAID_SAMPLES), seed)),
+}
+
+
+class Session:
+    __slots__ = ('game',)
+
+    def __init__(self, game: GameService):
+        self.game = game
+
+    def handle(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {'id': None, 'error': f"Bad JSON: {e}"}
+        req_id = request.get('id') if isinstance(request, dict) else None
+        if not isinstance(request, dict):
+            return {'id': None, 'error': "Request must be an object"}
+
+        method = METHODS.get(request.get('method'))
+        if method is None:
+            return {'id': req_id, 'error': f"Unknown method: {request.get('method')}"}
+        params = request.get('params') or []
+        try:
+            result = method(self.game, *params) if isinstance(params, list) else method(self.game, **params)
+        except Exception as e:
+            # One failing request must not drop the connection and the
+            # answers to the requests pipelined with it.
+            return {'id': req_id, 'error': str(e) or type(e).__name__}
+        return {'id': req_id, 'result': result}
+
+
+class GameServer:
+    def __init__(self, seed: Optional[int] = None, **container_kwargs):
+        self._seed = seed
+        # Sessions log nowhere unless the caller passes a logger.
+        container_kwargs.setdefault('logger', NullLogger())
+        # The catalog and tech tree are built once; each session is a scope
+        # that creates its own services only when a request first needs them.
+        self._root = build_root(**container_kwargs)
+        self._sessions = 0
+        self.active_sessions = 0
+
+    def new_session(self) -> Session:
+        seed = None if self._seed is None else self._seed + self._sessions
+        self._sessions += 1
+        return Session(city_scope(self._root, seed).resolve('game_service'))
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = self.new_session()
+        self.active_sessions += 1
+        pending = b''
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                lines = (pending + chunk).split(b'\n')
+                pending = lines.pop()
+                # A request that never ends would otherwise buffer without bound.
+                overflow = len(pending) > MAX_LINE_BYTES
+                # Every complete request in the chunk is answered with one write;
+                # other sessions get a turn between requests.
+                out = []
+                for line in lines:
+                    if line.strip():
+                        out.append(json.dumps(session.handle(line)).encode('utf-8') + b'\n')
+                        await asyncio.sleep(0)
+                if overflow:
+                    error = {'id': None, 'error': f"Request longer than {MAX_LINE_BYTES} bytes"}
+                    out.append(json.dumps(error).encode('utf-8') + b'\n')
+                if out:
+                    writer.write(b''.join(out))
+                    await writer.drain()
+                if overflow:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.active_sessions -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, unix_path: Optional[str] = None,
+                    backlog: int = 1024) -> None:
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path, backlog=backlog)
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port, backlog=backlog)
+        async with server:
+            await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve city sessions over a JSON-lines protocol")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--seed', type=int, default=None, help="base seed; session N uses seed + N")
+    parser.add_argument('--compact', action='store_true')
+    args = parser.parse_args()
+
+    server = GameServer(seed=args.seed, compact=args.compact)
+    asyncio.run(server.serve(args.host, args.port, args.unix))
+
+
+if __name__ == '__main__':
+    main()
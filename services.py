@@ -1,550 +1,1283 @@
-from __future__ import annotations
-from typing import Dict, Optional, Callable, List, Set
-import random
-from interfaces import (
-    IResourceManager, IProductionService, IConstructionService, IBuildingFactory,
-    IResearchService, ITradingService, IRaidService
-)
-from interfaces import IRepository
-from repositories import BuildingRepository, ResourceRepository
-from entities import (
-    Resource, Building, ProducerBuilding, StorageBuilding, WaterTower
-)
-
-class ResourceManager(IResourceManager):
-    def __init__(self, resource_repo: ResourceRepository):
-        self._repo = resource_repo
-        self._capacity: Dict[str, int] = {}
-        all_resources = [
-            'wood', 'stone', 'food', 'iron', 'energy', 'coal', 'sand', 'concrete', 'people', 
-            'graduates', 'masters', 'planks', 'water', 'fish', 'steel', 'research_points', 'ship',
-            'gold'
-        ]
-        
-        for r in all_resources:
-            if self._repo.get(r) is None:
-                self._repo.add(Resource(r, 0))
-            
-            if r == 'graduates':
-                self._capacity[r] = 10
-            elif r == 'masters':
-                self._capacity[r] = 5
-            elif r == 'ship':
-                self._capacity[r] = 5
-            elif r == 'gold':
-                self._capacity[r] = 1000
-            else:
-                self._capacity[r] = 100
-
-    def add_resource(self, name: str, amount: int) -> None:
-        res = self._repo.get(name)
-        if res is None: return
-        cap = self.get_capacity(name)
-        res.amount = min(res.amount + amount, cap)
-
-    def consume_resource(self, name: str, amount: int) -> bool:
-        res = self._repo.get(name)
-        if res is None or res.amount < amount:
-            return False
-        res.amount -= amount
-        return True
-    
-    def has_resource(self, name: str, amount: int) -> bool:
-        res = self._repo.get(name)
-        return res is not None and res.amount >= amount
-
-    def get_amount(self, name: str) -> int:
-        res = self._repo.get(name)
-        return res.amount if res else 0
-
-    def get_capacity(self, name: str) -> int:
-        return self._capacity.get(name, 0)
-
-    def increase_capacity(self, name: str, amount: int) -> None:
-        self._capacity[name] = self._capacity.get(name, 0) + amount
-
-
-class BuildingFactory(IBuildingFactory):
-    def __init__(self):
-        self._id_counter = 0
-
-    def _next_id(self) -> int:
-        self._id_counter += 1
-        return self._id_counter
-
-    def create(self, kind: str) -> Building:
-        if kind == 'logistics_center':
-            return Building(self._next_id(), 'logistics_center')
-
-        if kind == 'park':
-            return Building(self._next_id(), 'park')
-        if kind == 'carpenter':
-            return ProducerBuilding(self._next_id(), 'carpenter', produces={'planks': 1}, consumes={'wood': 1})
-        if kind == 'water_tower':
-            return WaterTower(self._next_id(), 'water_tower')
-        if kind == 'port':
-            return ProducerBuilding(self._next_id(), 'port', produces={'fish': 5}, consumes={'energy': 2})
-        if kind == 'metallurgy_plant':
-            return ProducerBuilding(self._next_id(), 'metallurgy_plant', produces={'steel': 1}, consumes={'iron': 1, 'coal': 1, 'energy': 5})
-        if kind == 'science_lab':
-            return ProducerBuilding(self._next_id(), 'science_lab', produces={'research_points': 1}, consumes={'planks': 1, 'energy': 3})
-        if kind == 'library':
-            return ProducerBuilding(self._next_id(), 'library', produces={'graduates': 1, 'research_points': 1}, consumes={'people': 1, 'energy': 2})
-
-        if kind == 'school':
-            return ProducerBuilding(self._next_id(), 'school', produces={'graduates': 1}, consumes={'people': 1, 'food': 1})
-        if kind == 'university':
-            return ProducerBuilding(self._next_id(), 'university', produces={'masters': 1}, consumes={'graduates': 1, 'energy': 5})
-        if kind == 'farm':
-            return ProducerBuilding(self._next_id(), 'farm', produces={'food': 10})
-        if kind == 'lumber_mill':
-            return ProducerBuilding(self._next_id(), 'lumber_mill', produces={'wood': 5})
-        if kind == 'coal_mine':
-            return ProducerBuilding(self._next_id(), 'coal_mine', produces={'coal': 5}, consumes={'wood': 1})
-        if kind == 'power_plant':
-            return ProducerBuilding(self._next_id(), 'power_plant', produces={'energy': 20}, consumes={'coal': 3})
-        if kind == 'quarry':
-            return ProducerBuilding(self._next_id(), 'quarry', produces={'stone': 5}, consumes={'energy': 1})
-        if kind == 'mine':
-            return ProducerBuilding(self._next_id(), 'mine', produces={'iron': 3}, consumes={'energy': 2})
-        if kind == 'sand_quarry':
-            return ProducerBuilding(self._next_id(), 'sand_quarry', produces={'sand': 5}, consumes={'energy': 1})
-        if kind == 'concrete_factory':
-            return ProducerBuilding(self._next_id(), 'concrete_factory', produces={'concrete': 4}, consumes={'stone': 2, 'sand': 2, 'energy': 5})
-        if kind == 'house':
-            return ProducerBuilding(self._next_id(), 'house', produces={'people': 1}, consumes={'food': 2})
-        if kind == 'warehouse':
-            return StorageBuilding(self._next_id(), 'warehouse', adds_capacity={'wood': 200, 'stone': 200, 'food': 200, 'iron': 100, 'coal': 100, 'planks': 100, 'steel': 50})
-
-        raise ValueError(f"Unknown building kind: {kind}")
-
-
-class ConstructionService(IConstructionService):
-    def __init__(self, resource_manager: IResourceManager, building_repo: BuildingRepository):
-        self._rm = resource_manager
-        self._buildings = building_repo
-
-    def can_build(self, blueprint: Dict[str, int]) -> bool:
-        for name, cost in blueprint.items():
-            if not self._rm.has_resource(name, cost):
-                return False
-        return True
-
-    def build(self, blueprint: Dict[str, int], build_fn: Callable[[], Building]) -> Optional[Building]:
-        if not self.can_build(blueprint):
-            return None
-        for name, cost in blueprint.items():
-            self._rm.consume_resource(name, cost)
-        
-        b = build_fn()
-        self._buildings.add(b)
-        
-        if hasattr(b, 'adds_capacity'):
-            for rname, inc in b.adds_capacity.items():
-                self._rm.increase_capacity(rname, inc)
-        return b
-    
-    def upgrade_building(self, building_id: int) -> tuple[bool, str]:
-        buildings = [b for b in self._buildings.all() if b.id == building_id]
-        if not buildings:
-            return False, "Building not found"
-        b = buildings[0]
-        
-        cost_wood = 20 * b.level
-        cost_stone = 20 * b.level
-        cost_concrete = 5 * b.level
-        
-        blueprint = {'wood': cost_wood, 'stone': cost_stone, 'concrete': cost_concrete}
-        
-        if not self.can_build(blueprint):
-            return False, f"Need resources for upgrade: {blueprint}"
-            
-        for name, cost in blueprint.items():
-            self._rm.consume_resource(name, cost)
-            
-        old_caps = {}
-        if hasattr(b, 'adds_capacity'):
-            old_caps = b.adds_capacity
-
-        b.upgrade()
-
-        if hasattr(b, 'adds_capacity'):
-            new_caps = b.adds_capacity
-            for rname, val in new_caps.items():
-                diff = val - old_caps.get(rname, 0)
-                self._rm.increase_capacity(rname, diff)
-            
-        return True, f"Upgraded {b.kind} to Level {b.level}"
-
-
-class ProductionService(IProductionService):
-    def __init__(self, building_repo: BuildingRepository, resource_manager: IResourceManager):
-        self._buildings = building_repo
-        self._rm = resource_manager
-
-    def tick(self) -> None:
-        people = self._rm.get_amount('people')
-        
-        if people > 0:
-            food_needed = max(1, int(people * 0.2)) 
-            if not self._rm.consume_resource('food', food_needed):
-                self._rm.consume_resource('people', max(1, int(people * 0.1)))
-                print(f"  [!] STARVATION: Not enough food.")
-
-        all_buidings_count = len(self._buildings.all())
-        water_needed = all_buidings_count
-        if water_needed > 0:
-            if not self._rm.consume_resource('water', water_needed):
-                print(f"  [!] DROUGHT: Not enough water (-{water_needed}).")
-                if people > 0:
-                     self._rm.consume_resource('people', 1)
-
-        for b in self._buildings.all():
-            if isinstance(b, ProducerBuilding):
-                self._process_producer(b)
-
-    def _process_producer(self, b: ProducerBuilding) -> None:
-        can_produce = True
-        for rname, amount in b.consumes.items():
-            if not self._rm.has_resource(rname, amount):
-                can_produce = False
-                break
-        
-        if can_produce:
-            for rname, amount in b.consumes.items():
-                self._rm.consume_resource(rname, amount)
-            for rname, amount in b.produces.items():
-                self._rm.add_resource(rname, amount)
-
-
-class ResearchService(IResearchService):
-    def __init__(self, resource_manager: IResourceManager):
-        self._rm = resource_manager
-        self._unlocked_techs: Set[str] = set()
-        
-        self._tech_tree = {
-            'basic_logistics': {
-                'cost': 10, 
-                'unlocks_buildings': ['warehouse', 'carpenter'],
-                'desc': 'Better storage and wood processing'
-            },
-            'fluid_mechanics': {
-                'cost': 20,
-                'unlocks_buildings': ['water_tower', 'port'],
-                'desc': 'Pumps and towers for water management'
-            },
-            'metallurgy': {
-                'cost': 50,
-                'unlocks_buildings': ['coal_mine', 'mine', 'metallurgy_plant'],
-                'desc': 'Mining and steel production'
-            },
-            'construction_ii': {
-                'cost': 40,
-                'unlocks_buildings': ['concrete_factory', 'sand_quarry'],
-                'desc': 'Advanced materials (Concrete)'
-            },
-            'advanced_education': {
-                'cost': 100,
-                'unlocks_buildings': ['university', 'science_lab'],
-                'desc': 'Higher learning and faster research'
-            },
-            'power_grid': {
-                'cost': 80,
-                'unlocks_buildings': ['power_plant'],
-                'desc': 'Massive energy production'
-            },
-            'trade_logistics': {
-                'cost': 60,
-                'unlocks_buildings': ['logistics_center'],
-                'desc': 'Unlock trading with other cities'
-            }
-        }
-        
-        self._base_buildings = {
-            'house', 'park', 'farm', 'lumber_mill', 'quarry', 'school', 'library'
-        }
-
-    def get_available_techs(self) -> Dict[str, dict]:
-        return {k: v for k, v in self._tech_tree.items() if k not in self._unlocked_techs}
-
-    def is_building_unlocked(self, kind: str) -> bool:
-        if kind in self._base_buildings:
-            return True
-        for tech in self._unlocked_techs:
-            if kind in self._tech_tree[tech]['unlocks_buildings']:
-                return True
-        return False
-
-    def research(self, tech_name: str) -> tuple[bool, str]:
-        if tech_name in self._unlocked_techs:
-            return False, "Already researched."
-        
-        tech = self._tech_tree.get(tech_name)
-        if not tech:
-            return False, "Unknown technology."
-        
-        cost = tech['cost']
-        if not self._rm.has_resource('research_points', cost):
-            return False, f"Need {cost} Research Points."
-        
-        self._rm.consume_resource('research_points', cost)
-        self._unlocked_techs.add(tech_name)
-        return True, f"Researched '{tech_name}'! Unlocked: {', '.join(tech['unlocks_buildings'])}"
-
-
-class TradingService(ITradingService):
-    def __init__(self, resource_manager: IResourceManager):
-        self._rm = resource_manager
-        
-        self._base_prices = {
-            'wood': 2, 'stone': 3, 'food': 2, 'coal': 4, 
-            'iron': 5, 'planks': 5, 'fish': 3, 'steel': 15,
-            'concrete': 10, 'water': 1
-        }
-        
-        self._available_cities = ["Kyiv", "Lviv", "Odesa", "Kharkiv", "Dnipro", "Poltava", "Vinnytsia"]
-        self._current_offers = {}
-        self._active_cities = []
-        
-        self._regenerate_market()
-
-    def _regenerate_market(self):
-        self._active_cities = random.sample(self._available_cities, 3)
-        self._current_offers = {}
-        
-        for city in self._active_cities:
-            self._current_offers[city] = self._generate_city_offers()
-
-    def _generate_city_offers(self) -> List[dict]:
-        offers = []
-        resources = list(self._base_prices.keys())
-        
-        buy_res = random.sample(resources, 4)
-        for r in buy_res:
-            base = self._base_prices[r]
-            price = max(1, int(base * random.uniform(1.2, 1.6)))
-            offers.append({
-                'type': 'BUY_FROM_CITY',
-                'resource': r,
-                'price_gold': price,
-                'amount': 10
-            })
-
-        sell_res = random.sample(resources, 4)
-        for r in sell_res:
-            base = self._base_prices[r]
-            price = max(1, int(base * random.uniform(0.7, 1.0)))
-            offers.append({
-                'type': 'SELL_TO_CITY',
-                'resource': r,
-                'price_gold': price,
-                'amount': 10
-            })
-            
-        return offers
-
-    def get_active_cities(self) -> List[str]:
-        return self._active_cities
-
-    def get_offers(self, city_name: str) -> List[dict]:
-        return self._current_offers.get(city_name, [])
-
-    def execute_trade(self, city_name: str, offer_index: int) -> tuple[bool, str]:
-        offers = self.get_offers(city_name)
-        if not offers or offer_index < 0 or offer_index >= len(offers):
-            return False, "Invalid offer."
-
-        offer = offers[offer_index]
-        res = offer['resource']
-        gold_price = offer['price_gold'] * offer['amount']
-        amount = offer['amount']
-
-        if offer['type'] == 'BUY_FROM_CITY':
-            if not self._rm.has_resource('gold', gold_price):
-                return False, f"Not enough Gold! Need {gold_price}."
-            
-            self._rm.consume_resource('gold', gold_price)
-            self._rm.add_resource(res, amount)
-            return True, f"Bought {amount} {res} for {gold_price} Gold."
-
-        elif offer['type'] == 'SELL_TO_CITY':
-            if not self._rm.has_resource(res, amount):
-                return False, f"Not enough {res}! Need {amount}."
-            
-            self._rm.consume_resource(res, amount)
-            self._rm.add_resource('gold', gold_price)
-            return True, f"Sold {amount} {res} for {gold_price} Gold."
-            
-        return False, "Unknown trade type."
-
-
-class RaidService(IRaidService):
-    def __init__(self, resource_manager: IResourceManager):
-        self._rm = resource_manager
-        self._loot_values = {
-            'wood': 2, 'stone': 3, 'food': 2, 'coal': 4,
-            'iron': 5, 'planks': 5, 'fish': 3, 'steel': 15,
-            'concrete': 10, 'gold': 1
-        }
-
-    def execute_raid(self) -> tuple[bool, str]:
-        ships = self._rm.get_amount('ship')
-        if ships <= 0:
-            return False, "You have 0 ships! Build a fleet first."
-
-        base_chance = random.uniform(0, 40)
-        ship_bonus = ships * 10
-        win_chance = base_chance + ship_bonus
-        
-        roll = random.uniform(0, 100)
-        is_victory = roll <= win_chance
-
-        if is_victory:
-            num_rewards = random.randint(3, 5)
-            possible_loot = list(self._loot_values.keys())
-            loot_types = random.sample(possible_loot, num_rewards)
-            
-            loot_msg = []
-            for r in loot_types:
-                price = self._loot_values[r]
-                base_qty = 50 / price 
-                qty = max(1, int(base_qty * random.uniform(0.5, 1.5)))
-                self._rm.add_resource(r, qty)
-                loot_msg.append(f"{qty} {r}")
-            
-            return True, f"VICTORY! (Chance: {int(win_chance)}%) Loot: {', '.join(loot_msg)}"
-        else:
-            loss = random.randint(1, 2)
-            actual_loss = min(ships, loss)
-            self._rm.consume_resource('ship', actual_loss)
-            return False, f"DEFEAT! (Chance: {int(win_chance)}%) You lost {actual_loss} ship(s)."
-
-
-class GameService:
-    def __init__(self, 
-                 rm: IResourceManager, 
-                 br: IRepository, 
-                 factory: IBuildingFactory, 
-                 constr: IConstructionService, 
-                 prod: IProductionService, 
-                 research: IResearchService, 
-                 trading: ITradingService, 
-                 raid: IRaidService):
-        self._rm = rm
-        self._br = br
-        self._factory = factory
-        self._constr = constr
-        self._prod = prod
-        self._research = research
-        self._trading = trading
-        self._raid = raid
-        
-        self._building_configs = {
-        'living': {
-            'house': {'wood': 30, 'stone': 15}, 
-            'park': {'wood': 20, 'people': 1},
-            'school': {'wood': 50, 'stone': 30, 'people': 2},
-            'library': {'wood': 30, 'stone': 60, 'people': 2},
-            'university': {'iron': 100, 'concrete': 80, 'energy': 50, 'people': 10},
-        },
-        'industrial': {
-            'carpenter': {'wood': 40, 'stone': 20, 'people': 3},
-            'metallurgy_plant': {'stone': 150, 'concrete': 50, 'energy': 40, 'people': 8},
-            'science_lab': {'stone': 100, 'iron': 50, 'planks': 80, 'people': 6},
-            'power_plant': {'stone': 120, 'iron': 50, 'concrete': 30, 'people': 5},
-            'concrete_factory': {'stone': 100, 'iron': 30, 'energy': 20, 'people': 4},
-            'warehouse': {'wood': 80, 'stone': 80, 'planks': 40, 'people': 2},
-            'port': {'wood': 250, 'stone': 150, 'planks': 150, 'people': 10},
-            'logistics_center': {'wood': 200, 'stone': 200, 'planks': 100, 'concrete': 50, 'people': 5}
-        },
-        'infrastructure': {
-            'water_tower': {'stone': 40, 'iron': 15, 'planks': 20, 'people': 3},
-        },
-        'mining': {
-            'farm': {'wood': 20, 'stone': 10},
-            'lumber_mill': {'wood': 25, 'stone': 10, 'people': 2},
-            'coal_mine': {'wood': 40, 'stone': 40, 'people': 4},
-            'quarry': {'wood': 30, 'people': 2},
-            'mine': {'wood': 80, 'stone': 100, 'planks': 40, 'people': 5},
-            'sand_quarry': {'wood': 30, 'stone': 20, 'people': 2},
-        }
-    }
-    def list_resources(self) -> Dict[str, int]:
-        return {r.name: r.amount for r in self._rm._repo.all()}
-
-    def list_buildings(self) -> List[Building]:
-        return self._br.all()
-
-    def get_building_catalog(self) -> Dict[str, Dict[str, Dict[str, int]]]:
-        return self._building_configs
-
-    def list_research(self) -> Dict[str, dict]:
-        return self._research.get_available_techs()
-
-    def research_tech(self, tech_name: str) -> tuple[bool, str]:
-        return self._research.research(tech_name)
-
-    def build(self, kind: str) -> tuple[bool, str]:
-        if not self._research.is_building_unlocked(kind):
-            return False, "Technology locked! Research it first."
-
-        bp = None
-        for cat_bldgs in self._building_configs.values():
-            if kind in cat_bldgs:
-                bp = cat_bldgs[kind]
-                break
-        
-        if not bp:
-            return False, f"Unknown blueprint for {kind}"
-
-        if not self._rm.has_resource('people', 2):
-             return False, "Not enough idle people (need 2) to build"
-        
-        b = self._constr.build(bp, lambda: self._factory.create(kind))
-        if b is None:
-            return False, f"Insufficient resources for {kind}: {bp}"
-            
-        return True, f"Built {b.summary()}"
-
-    def build_ship(self) -> tuple[bool, str]:
-        ports = [b for b in self._br.all() if b.kind == 'port']
-        if not ports:
-            return False, "You need a PORT to build ships!"
-        
-        cost = {'planks': 50, 'steel': 10, 'energy': 20}
-        
-        for r, amount in cost.items():
-            if not self._rm.has_resource(r, amount):
-                return False, f"Not enough resources for Ship: {cost}"
-        
-        for r, amount in cost.items():
-            self._rm.consume_resource(r, amount)
-
-        self._rm.add_resource('ship', 1)
-        return True, "Ship launched successfully! (+1 Fleet)"
-
-    def upgrade(self, building_id: int) -> tuple[bool, str]:
-        return self._constr.upgrade_building(building_id)
-
-    def tick(self) -> None:
-        self._prod.tick()
-
-    def get_trading_cities(self) -> List[str]:
-        centers = [b for b in self._br.all() if b.kind == 'logistics_center']
-        if not centers:
-            return []
-        return self._trading.get_active_cities()
-
-    def get_city_offers(self, city: str) -> List[dict]:
-        return self._trading.get_offers(city)
-
-    def trade(self, city: str, offer_idx: int) -> tuple[bool, str]:
-        centers = [b for b in self._br.all() if b.kind == 'logistics_center']
-        if not centers:
-            return False, "Build Logistics Center first!"
-        return self._trading.execute_trade(city, offer_idx)
-
-    def raid(self) -> tuple[bool, str]:
-        return self._raid.execute_raid()
-
-
+from __future__ import annotations
+from typing import Deque, Dict, Optional, Callable, Iterable, List, Mapping, Sequence, Set
+from array import array
+import copy
+from collections import deque
+import heapq
+import logging
+import random
+import threading
+import time
+from interfaces import (
+    IResourceManager, IProductionService, IConstructionService, IBuildingFactory,
+    IResearchService, ITradingService, IRaidService, ITickProbe, ILogger, IResourceHistory, IContainer
+)
+from catalog import BuildingCatalog, load_catalog
+from logger import NullLogger
+from repositories import BuildingRepository, ResourceRepository
+from entities import Building, BuildingStack, RateTable, AdvanceReport, RaidEstimate, add_ticks
+
+def rng_state(rng: random.Random) -> list:
+    version, internal, gauss_next = rng.getstate()
+    return [version, list(internal), gauss_next]
+
+
+def restore_rng(rng: random.Random, state: list) -> None:
+    version, internal, gauss_next = state
+    rng.setstate((version, tuple(internal), gauss_next))
+
+
+def fork_rng(rng: random.Random) -> random.Random:
+    child = random.Random(0)
+    child.setstate(rng.getstate())
+    return child
+
+
+RESOURCE_CAPACITIES = {
+    'wood': 100, 'stone': 100, 'food': 100, 'iron': 100, 'energy': 100, 'coal': 100, 'sand': 100,
+    'concrete': 100, 'people': 100, 'graduates': 10, 'masters': 5, 'planks': 100, 'water': 100,
+    'fish': 100, 'steel': 100, 'research_points': 100, 'ship': 5, 'gold': 1000
+}
+
+
+def flow_order(nodes: Sequence[tuple]) -> tuple[List[int], List[int]]:
+    # nodes[i] is (consumed resources, produced resources) of one producer kind,
+    # listed in order of first appearance. Returns a rank and a batch per node:
+    # ranks follow the resource flow with each cycle collapsed to one step, and
+    # batches group nodes that share no resource with any other batch.
+    n = len(nodes)
+    consumers: Dict[int, List[int]] = {}
+    for i, (consumes, _) in enumerate(nodes):
+        for r in consumes:
+            consumers.setdefault(r, []).append(i)
+    edges = [sorted({j for r in produces for j in consumers.get(r, ()) if j != i})
+             for i, (_, produces) in enumerate(nodes)]
+
+    # Tarjan's strongly connected components, iteratively.
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack: List[int] = []
+    component = [-1] * n
+    n_components = 0
+    counter = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, pos = work.pop()
+            if pos == 0:
+                index[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            for k in range(pos, len(edges[v])):
+                w = edges[v][k]
+                if index[w] == -1:
+                    work.append((v, k + 1))
+                    work.append((w, 0))
+                    break
+                if on_stack[w]:
+                    low[v] = min(low[v], index[w])
+            else:
+                if low[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component[w] = n_components
+                        if w == v:
+                            break
+                    n_components += 1
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+
+    # Kahn's algorithm over the components, earliest-built component first.
+    first = [n] * n_components
+    for i in range(n):
+        first[component[i]] = min(first[component[i]], i)
+    successors: List[Set[int]] = [set() for _ in range(n_components)]
+    indegree = [0] * n_components
+    for i in range(n):
+        for j in edges[i]:
+            a, b = component[i], component[j]
+            if a != b and b not in successors[a]:
+                successors[a].add(b)
+                indegree[b] += 1
+    ready = [(first[c], c) for c in range(n_components) if indegree[c] == 0]
+    heapq.heapify(ready)
+    component_rank = [0] * n_components
+    rank = 0
+    while ready:
+        _, c = heapq.heappop(ready)
+        component_rank[c] = rank
+        rank += 1
+        for d in successors[c]:
+            indegree[d] -= 1
+            if indegree[d] == 0:
+                heapq.heappush(ready, (first[d], d))
+
+    parent = list(range(n))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner: Dict[int, int] = {}
+    for i, (consumes, produces) in enumerate(nodes):
+        for r in (*consumes, *produces):
+            j = owner.setdefault(r, i)
+            parent[find(i)] = find(j)
+    batch_ids: Dict[int, int] = {}
+    batches = [batch_ids.setdefault(find(i), len(batch_ids)) for i in range(n)]
+    return [component_rank[component[i]] for i in range(n)], batches
+
+
+def fire_stack(amounts: List[int], caps: List[int], consumes: Sequence[tuple[int, int]],
+               produces: Sequence[tuple[int, int]], count: int, overlap: bool = False) -> int:
+    # Runs `count` identical producers back to back and returns how many fired.
+    # Each one consumes before producing, so the first k fire exactly when the
+    # inputs cover k of them, and k capped additions clamp like one addition of
+    # k times the amount. A kind that consumes what it produces breaks that
+    # shortcut and is stepped one building at a time.
+    if overlap:
+        fired = 0
+        while fired < count:
+            for rid, amount in consumes:
+                if amounts[rid] < amount:
+                    return fired
+            for rid, amount in consumes:
+                amounts[rid] -= amount
+            for rid, amount in produces:
+                total = amounts[rid] + amount
+                amounts[rid] = total if total < caps[rid] else caps[rid]
+            fired += 1
+        return fired
+
+    fired = count
+    for rid, amount in consumes:
+        if amount > 0 and amounts[rid] < amount * fired:
+            fired = amounts[rid] // amount
+    if fired <= 0:
+        return 0
+    for rid, amount in consumes:
+        amounts[rid] -= amount * fired
+    for rid, amount in produces:
+        total = amounts[rid] + amount * fired
+        amounts[rid] = total if total < caps[rid] else caps[rid]
+    return fired
+
+
+class ResourceManager(IResourceManager):
+    def __init__(self, resource_repo: ResourceRepository):
+        self._repo = resource_repo
+        for r, cap in RESOURCE_CAPACITIES.items():
+            self._repo.capacities[self._repo.intern(r)] = cap
+        self._amounts = self._repo.amounts
+        self._capacity = self._repo.capacities
+        self._lock = threading.RLock()
+
+    @property
+    def amounts(self) -> List[int]:
+        return self._amounts
+
+    @property
+    def capacities(self) -> List[int]:
+        return self._capacity
+
+    def resource_id(self, name: str) -> Optional[int]:
+        return self._repo.id_of(name)
+
+    def fork(self) -> ResourceManager:
+        rm = copy.copy(self)
+        rm._repo = self._repo.fork()
+        rm._amounts = rm._repo.amounts
+        rm._capacity = rm._repo.capacities
+        rm._lock = threading.RLock()
+        return rm
+
+    def add_by_id(self, rid: int, amount: int) -> None:
+        with self._lock:
+            self._amounts[rid] = min(self._amounts[rid] + amount, self._capacity[rid])
+
+    def consume_by_id(self, rid: int, amount: int) -> bool:
+        with self._lock:
+            if self._amounts[rid] < amount:
+                return False
+            self._amounts[rid] -= amount
+            return True
+
+    def has_by_id(self, rid: int, amount: int) -> bool:
+        return self._amounts[rid] >= amount
+
+    def transaction(self) -> threading.RLock:
+        return self._lock
+
+    def try_apply(self, deltas: Mapping[str, int]) -> bool:
+        costs = []
+        gains = []
+        for name, delta in deltas.items():
+            rid = self._repo.id_of(name)
+            if delta < 0:
+                if rid is None:
+                    return False
+                costs.append((rid, -delta))
+            elif delta > 0 and rid is not None:
+                gains.append((rid, delta))
+        return self.try_apply_ids(costs, gains)
+
+    def try_apply_ids(self, costs: Sequence[tuple[int, int]], gains: Sequence[tuple[int, int]] = ()) -> bool:
+        amounts = self._amounts
+        with self._lock:
+            for rid, amount in costs:
+                if amounts[rid] < amount:
+                    return False
+            for rid, amount in costs:
+                amounts[rid] -= amount
+            caps = self._capacity
+            for rid, amount in gains:
+                total = amounts[rid] + amount
+                amounts[rid] = total if total < caps[rid] else caps[rid]
+            return True
+
+    def add_resource(self, name: str, amount: int) -> None:
+        rid = self._repo.id_of(name)
+        if rid is None: return
+        self.add_by_id(rid, amount)
+
+    def consume_resource(self, name: str, amount: int) -> bool:
+        rid = self._repo.id_of(name)
+        return rid is not None and self.consume_by_id(rid, amount)
+    
+    def has_resource(self, name: str, amount: int) -> bool:
+        rid = self._repo.id_of(name)
+        return rid is not None and self._amounts[rid] >= amount
+
+    def get_amount(self, name: str) -> int:
+        rid = self._repo.id_of(name)
+        return self._amounts[rid] if rid is not None else 0
+
+    def get_capacity(self, name: str) -> int:
+        rid = self._repo.id_of(name)
+        return self._capacity[rid] if rid is not None else 0
+
+    def increase_capacity(self, name: str, amount: int) -> None:
+        rid = self._repo.id_of(name)
+        if rid is not None:
+            self._capacity[rid] += amount
+
+
+class BuildingFactory(IBuildingFactory):
+    def __init__(self, catalog: Optional[BuildingCatalog] = None):
+        self._catalog = catalog or load_catalog()
+        self._id_counter = 0
+
+    def _next_id(self) -> int:
+        self._id_counter += 1
+        return self._id_counter
+
+    def snapshot_state(self) -> int:
+        return self._id_counter
+
+    def restore_state(self, state: int) -> None:
+        self._id_counter = state
+
+    def create(self, kind: str) -> Building:
+        return self._create(kind, self._next_id())
+
+    def restore(self, kind: str, building_id: int, level: int) -> Building:
+        b = self._create(kind, building_id)
+        for _ in range(level - 1):
+            b.upgrade()
+        return b
+
+    def _create(self, kind: str, id_: int) -> Building:
+        spec = self._catalog.spec(kind)
+        if spec is None:
+            raise ValueError(f"Unknown building kind: {kind}")
+        return spec.create(id_)
+
+
+class ConstructionService(IConstructionService):
+    def __init__(self, resource_manager: IResourceManager, building_repo: BuildingRepository):
+        self._rm = resource_manager
+        self._buildings = building_repo
+
+    def can_build(self, blueprint: Dict[str, int]) -> bool:
+        for name, cost in blueprint.items():
+            if not self._rm.has_resource(name, cost):
+                return False
+        return True
+
+    def build(self, blueprint: Dict[str, int], build_fn: Callable[[], Building]) -> Optional[Building]:
+        if not self._rm.try_apply({name: -cost for name, cost in blueprint.items()}):
+            return None
+        
+        b = build_fn()
+        self._buildings.add(b)
+        
+        if hasattr(b, 'adds_capacity'):
+            for rname, inc in b.adds_capacity.items():
+                self._rm.increase_capacity(rname, inc)
+        return b
+    
+    @staticmethod
+    def upgrade_cost(level: int) -> Dict[str, int]:
+        return {'wood': 20 * level, 'stone': 20 * level, 'concrete': 5 * level}
+
+    def upgrade_building(self, building_id: int) -> tuple[bool, str]:
+        b = self._buildings.get(building_id)
+        if b is None:
+            return False, "Building not found"
+        
+        blueprint = self.upgrade_cost(b.level)
+        
+        if not self._rm.try_apply({name: -cost for name, cost in blueprint.items()}):
+            return False, f"Need resources for upgrade: {blueprint}"
+            
+        old_caps = {}
+        if hasattr(b, 'adds_capacity'):
+            old_caps = b.adds_capacity
+
+        b = self._buildings.upgrade(building_id)
+
+        if hasattr(b, 'adds_capacity'):
+            new_caps = b.adds_capacity
+            for rname, val in new_caps.items():
+                diff = val - old_caps.get(rname, 0)
+                self._rm.increase_capacity(rname, diff)
+            
+        return True, f"Upgraded {b.kind} to Level {b.level}"
+
+
+_UNBOUNDED = 1 << 62
+
+
+class ProductionService(IProductionService):
+    # Longest cycle of repeating amounts that advance() recognises.
+    max_cycle = 64
+
+    def __init__(self, building_repo: BuildingRepository, resource_manager: ResourceManager,
+                 logger: Optional[ILogger] = None):
+        self._buildings = building_repo
+        self._rm = resource_manager
+        self._plan: List[tuple] = []
+        self._plan_key = None
+        self._resolved: Dict[RateTable, tuple] = {}
+        self._resolved_size = 0
+        self._people = resource_manager.resource_id('people')
+        self._food = resource_manager.resource_id('food')
+        self._water = resource_manager.resource_id('water')
+        self._probe: Optional[ITickProbe] = None
+        self._history: Optional[IResourceHistory] = None
+        self._log = logger or NullLogger()
+        self._order: List[BuildingStack] = []
+        self._batches: List[tuple[int, int]] = []
+        self._order_version = -1
+
+    def set_instrumentation(self, probe: Optional[ITickProbe]) -> None:
+        self._probe = probe
+
+    def set_history(self, history: Optional[IResourceHistory]) -> None:
+        self._history = history
+
+    def tick(self) -> None:
+        if self._probe is None:
+            starved, water_shortage = self._consume_upkeep()
+            self._run_producers()
+        else:
+            starved, water_shortage = self._instrumented_tick(self._probe)
+        if self._history is not None:
+            self._history.record(self._rm.amounts)
+        if starved:
+            self._log.log("STARVATION: Not enough food.", logging.WARNING, event='starvation')
+        if water_shortage:
+            self._log.log(f"DROUGHT: Not enough water (-{water_shortage}).", logging.WARNING,
+                          event='drought', shortage=water_shortage)
+
+    def advance(self, n_ticks: int) -> AdvanceReport:
+        amounts = self._rm.amounts
+        before = list(amounts)
+        report = AdvanceReport(ticks=n_ticks)
+        probe = self._probe
+        history = self._history
+        run_producers = self._producer_runner() if probe is None else None
+        # Skipping needs every tick to be a plain function of the amounts, so
+        # it is off while a probe or a history watches each tick.
+        skip = probe is None and history is None
+        plan = self._compile_plan() if skip else None
+        seen: Dict[tuple, int] = {}
+        recent: Deque[tuple] = deque()
+        flags: Deque[tuple] = deque(maxlen=self.max_cycle)
+        last = list(amounts)
+        delta: Optional[List[int]] = None
+        retry_at, backoff = 0, 1
+        t = 0
+        while t < n_ticks:
+            if probe is None:
+                starved, water_shortage = self._consume_upkeep()
+                run_producers()
+            else:
+                starved, water_shortage = self._instrumented_tick(probe)
+            if history is not None:
+                history.record(amounts)
+            if starved:
+                add_ticks(report.starvation_ticks, t, t + 1)
+            if water_shortage:
+                add_ticks(report.drought_ticks, t, t + 1)
+            t += 1
+            if not skip or t == n_ticks:
+                continue
+
+            flags.append((starved, bool(water_shortage)))
+            step = [now - then for now, then in zip(amounts, last)]
+            last = list(amounts)
+            key = (self._buildings.version, tuple(amounts))
+            start = seen.get(key)
+            if start is not None:
+                # The amounts repeat, so the ticks in between repeat forever.
+                period = t - start
+                jump = (n_ticks - t) // period * period
+                pattern = list(flags)[-period:]
+                for runs, column in ((report.starvation_ticks, 0), (report.drought_ticks, 1)):
+                    offsets = [i for i, f in enumerate(pattern) if f[column]]
+                    if len(offsets) == period:
+                        add_ticks(runs, t, t + jump)
+                        continue
+                    for i in offsets:
+                        add_ticks(runs, t + i, t + jump, period)
+                t += jump
+                delta = step
+                continue
+            seen[key] = t
+            recent.append(key)
+            if len(recent) > self.max_cycle:
+                del seen[recent.popleft()]
+
+            if step == delta and t >= retry_at and any(step):
+                horizon, starved, drought = self._linear_horizon(last, step, plan)
+                if horizon < 0:
+                    retry_at, backoff = t + backoff, min(backoff * 2, 1024)
+                else:
+                    jump = min(horizon + 1, n_ticks - t)
+                    with self._rm.transaction():
+                        for rid, d in enumerate(step):
+                            amounts[rid] += d * jump
+                    if starved:
+                        add_ticks(report.starvation_ticks, t, t + jump)
+                    if drought:
+                        add_ticks(report.drought_ticks, t, t + jump)
+                    t += jump
+                    last = list(amounts)
+                    seen.clear()
+                    recent.clear()
+                    flags.clear()
+                    backoff = 1
+            delta = step
+
+        names = self._rm._repo.names
+        report.deltas = {names[rid]: amounts[rid] - before[rid] for rid in range(len(before))}
+        return report
+
+    def _linear_horizon(self, x: List[int], d: List[int], plan: List[tuple]) -> tuple[int, bool, bool]:
+        # Replays one tick from x symbolically, treating every amount as
+        # x + j*d. Each comparison the tick makes is linear in j, so it keeps
+        # its outcome up to some j; while all of them do, every tick adds
+        # exactly d. Returns the largest such j, or -1 if a tick from x does
+        # not add d, along with the starvation and drought flags of those ticks.
+        caps = self._rm.capacities
+        a = list(x)
+        slope = list(d)
+        horizon = _UNBOUNDED
+
+        def keeps(v: int, s: int, bound: int) -> int:
+            # How many more steps `v + s*j >= bound` keeps its current truth value.
+            if v >= bound:
+                return _UNBOUNDED if s >= 0 else (v - bound) // -s
+            return _UNBOUNDED if s <= 0 else (bound - v - 1) // s
+
+        people, food, water = self._people, self._food, self._water
+        if slope[people]:
+            return -1, False, False
+        population = a[people]
+        starved = drought = False
+        if population > 0:
+            need = max(1, int(population * 0.2))
+            horizon = min(horizon, keeps(a[food], slope[food], need))
+            if a[food] >= need:
+                a[food] -= need
+            else:
+                starved = True
+                lost = max(1, int(population * 0.1))
+                if a[people] >= lost:
+                    a[people] -= lost
+        need = len(self._buildings)
+        if need > 0:
+            horizon = min(horizon, keeps(a[water], slope[water], need))
+            if a[water] >= need:
+                a[water] -= need
+            else:
+                drought = True
+                if population > 0 and a[people] >= 1:
+                    a[people] -= 1
+
+        for consumes, produces, count, overlap in plan:
+            if overlap:
+                return -1, False, False
+            fired = count
+            for rid, amount in consumes:
+                if amount <= 0:
+                    continue
+                covered = min(a[rid] // amount, count)
+                horizon = min(horizon, keeps(a[rid], slope[rid], covered * amount))
+                if covered < count:
+                    horizon = min(horizon, keeps(a[rid], slope[rid], (covered + 1) * amount))
+                fired = min(fired, covered)
+            if fired <= 0:
+                continue
+            for rid, amount in consumes:
+                a[rid] -= amount * fired
+            for rid, amount in produces:
+                total = a[rid] + amount * fired
+                horizon = min(horizon, keeps(total, slope[rid], caps[rid]))
+                if total < caps[rid]:
+                    a[rid] = total
+                else:
+                    a[rid] = caps[rid]
+                    slope[rid] = 0
+
+        for rid in range(len(a)):
+            if a[rid] != x[rid] + d[rid] or slope[rid] != d[rid]:
+                return -1, False, False
+        return horizon, starved, drought
+
+    def _consume_upkeep(self) -> tuple[bool, int]:
+        people = self._rm.amounts[self._people]
+        return self._consume_food(people), self._consume_water(people)
+
+    def _consume_food(self, people: int) -> bool:
+        if people > 0:
+            food_needed = max(1, int(people * 0.2)) 
+            if not self._rm.consume_by_id(self._food, food_needed):
+                self._rm.consume_by_id(self._people, max(1, int(people * 0.1)))
+                return True
+        return False
+
+    def _consume_water(self, people: int) -> int:
+        all_buidings_count = len(self._buildings)
+        water_needed = all_buidings_count
+        if water_needed > 0:
+            if not self._rm.consume_by_id(self._water, water_needed):
+                if people > 0:
+                     self._rm.consume_by_id(self._people, 1)
+                return water_needed
+        return 0
+
+    def _instrumented_tick(self, probe: ITickProbe) -> tuple[bool, int]:
+        clock = time.perf_counter
+        amounts = self._rm.amounts
+        names = self._rm._repo.names
+        people = amounts[self._people]
+
+        t0 = clock()
+        starved = self._consume_food(people)
+        t1 = clock()
+        water_shortage = self._consume_water(people)
+        t2 = clock()
+
+        kinds: Dict[str, list] = {}
+        blocked_by: Dict[str, int] = {}
+        caps = self._rm.capacities
+        with self._rm.transaction():
+            for stack in self._production_order():
+                start = clock()
+                consumes, produces, overlap = self._resolve_rates(stack.rates)
+                blocker = '<unknown>' if consumes is None else None
+                fired = 0
+                if consumes is not None:
+                    fired = fire_stack(amounts, caps, consumes, produces, stack.count, overlap)
+                    if fired < stack.count:
+                        blocker = next(names[rid] for rid, amount in consumes if amounts[rid] < amount)
+                stats = kinds.get(stack.kind)
+                if stats is None:
+                    stats = kinds[stack.kind] = [0.0, 0, 0]
+                stats[0] += clock() - start
+                stats[1] += stack.count
+                if blocker is not None:
+                    stats[2] += stack.count - fired
+                    blocked_by[blocker] = blocked_by.get(blocker, 0) + stack.count - fired
+        t3 = clock()
+
+        probe.record_tick({
+            'phases': {'food': t1 - t0, 'water': t2 - t1, 'producers': t3 - t2},
+            'kinds': {kind: {'seconds': sec, 'count': count, 'stalled': stalled}
+                      for kind, (sec, count, stalled) in kinds.items()},
+            'blocked_by': blocked_by,
+            'starved': starved,
+            'drought': water_shortage > 0,
+        })
+        return starved, water_shortage
+
+    def _run_producers(self) -> None:
+        amounts = self._rm.amounts
+        caps = self._rm.capacities
+        with self._rm.transaction():
+            for stack in self._production_order():
+                consumes, produces, overlap = self._resolve_rates(stack.rates)
+                if consumes is not None:
+                    fire_stack(amounts, caps, consumes, produces, stack.count, overlap)
+
+    def _production_order(self) -> List[BuildingStack]:
+        self._sync_order()
+        return self._order
+
+    def production_batches(self) -> List[List[BuildingStack]]:
+        self._sync_order()
+        return [self._order[start:end] for start, end in self._batches]
+
+    def _sync_order(self) -> None:
+        # Producers run as (kind, level) stacks, upstream first, so a plant
+        # never waits a tick for inputs its suppliers make in the same tick.
+        # The order only changes when a building is built or upgraded.
+        if self._order_version == self._buildings.version:
+            return
+        stacks = self._buildings.stacks()
+        kinds: Dict[str, int] = {}
+        nodes = []
+        for stack in stacks:
+            if stack.kind not in kinds:
+                kinds[stack.kind] = len(nodes)
+                consumes, produces, _ = self._resolve_rates(stack.rates)
+                nodes.append((tuple(r for r, _ in consumes or ()), tuple(r for r, _ in produces)))
+        ranks, batches = flow_order(nodes)
+
+        def key(stack: BuildingStack) -> tuple:
+            node = kinds[stack.kind]
+            return batches[node], ranks[node], node, stack.level
+
+        self._order = sorted((stack for stack in stacks if stack.count), key=key)
+        self._batches = []
+        start = 0
+        for i in range(1, len(self._order) + 1):
+            if i == len(self._order) or key(self._order[i])[0] != key(self._order[start])[0]:
+                self._batches.append((start, i))
+                start = i
+        self._order_version = self._buildings.version
+
+    def _resolve_rates(self, rates: RateTable) -> tuple[Optional[tuple], tuple, bool]:
+        names = self._rm._repo.names
+        if len(names) != self._resolved_size:
+            self._resolved.clear()
+            self._resolved_size = len(names)
+        row = self._resolved.get(rates)
+        if row is None:
+            rid = self._rm.resource_id
+            consumes = tuple((rid(r), amount) for r, amount in rates.consumes.items())
+            if any(i is None for i, _ in consumes):
+                consumes = None
+            produces = tuple((rid(r), amount) for r, amount in rates.produces.items() if rid(r) is not None)
+            overlap = consumes is not None and bool({r for r, _ in consumes} & {r for r, _ in produces})
+            row = self._resolved[rates] = (consumes, produces, overlap)
+        return row
+
+    def _producer_runner(self) -> Callable[[], None]:
+        key = (self._buildings.version, tuple(self._rm.capacities))
+        if key != self._plan_key:
+            self._plan = self._compile_plan()
+            self._plan_key = key
+        plan = self._plan
+        amounts = self._rm.amounts
+        caps = self._rm.capacities
+        lock = self._rm.transaction()
+
+        def run() -> None:
+            with lock:
+                for consumes, produces, count, overlap in plan:
+                    fire_stack(amounts, caps, consumes, produces, count, overlap)
+        return run
+
+    def _compile_plan(self) -> List[tuple]:
+        plan = []
+        for stack in self._production_order():
+            consumes, produces, overlap = self._resolve_rates(stack.rates)
+            if consumes is not None:
+                plan.append((consumes, produces, stack.count, overlap))
+        return plan
+
+
+class TechTree:
+    # Read-only research data derived from the catalog; every city built from
+    # the same catalog can share one.
+    def __init__(self, catalog: Optional[BuildingCatalog] = None):
+        catalog = catalog or load_catalog()
+        self.techs: Dict[str, dict] = {
+            'basic_logistics': {
+                'cost': 10, 
+                'requires': [],
+                'desc': 'Better storage and wood processing'
+            },
+            'fluid_mechanics': {
+                'cost': 20,
+                'requires': ['basic_logistics'],
+                'desc': 'Pumps and towers for water management'
+            },
+            'metallurgy': {
+                'cost': 50,
+                'requires': ['basic_logistics'],
+                'desc': 'Mining and steel production'
+            },
+            'construction_ii': {
+                'cost': 40,
+                'requires': ['basic_logistics'],
+                'desc': 'Advanced materials (Concrete)'
+            },
+            'advanced_education': {
+                'cost': 100,
+                'requires': ['construction_ii'],
+                'desc': 'Higher learning and faster research'
+            },
+            'power_grid': {
+                'cost': 80,
+                'requires': ['metallurgy'],
+                'desc': 'Massive energy production'
+            },
+            'trade_logistics': {
+                'cost': 60,
+                'requires': ['basic_logistics'],
+                'desc': 'Unlock trading with other cities'
+            }
+        }
+        
+        for tech in catalog.techs():
+            if tech not in self.techs:
+                raise ValueError(f"Buildings {catalog.unlocked_by(tech)} require unknown technology '{tech}'")
+        for name, tech in self.techs.items():
+            tech['unlocks_buildings'] = list(catalog.unlocked_by(name))
+        self.base_buildings = set(catalog.unlocked_by(None))
+
+        # Every building kind gets one bit; a kind is unlocked when its bit is set.
+        self.kind_bits: Dict[str, int] = {}
+        for kind in sorted(self.base_buildings):
+            self.kind_bits[kind] = 1 << len(self.kind_bits)
+        self.tech_bits: Dict[str, int] = {}
+        self.dependents: Dict[str, List[str]] = {name: [] for name in self.techs}
+        for name, tech in self.techs.items():
+            mask = 0
+            for kind in tech['unlocks_buildings']:
+                bit = self.kind_bits.get(kind)
+                if bit is None:
+                    bit = self.kind_bits[kind] = 1 << len(self.kind_bits)
+                mask |= bit
+            self.tech_bits[name] = mask
+            for req in tech['requires']:
+                if req not in self.techs:
+                    raise ValueError(f"Technology '{name}' requires unknown '{req}'")
+                self.dependents[req].append(name)
+        self.base_mask = sum(self.kind_bits[kind] for kind in self.base_buildings)
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        missing = {name: len(tech['requires']) for name, tech in self.techs.items()}
+        ready = [name for name, n in missing.items() if n == 0]
+        seen = 0
+        while ready:
+            name = ready.pop()
+            seen += 1
+            for dep in self.dependents[name]:
+                missing[dep] -= 1
+                if missing[dep] == 0:
+                    ready.append(dep)
+        if seen != len(self.techs):
+            raise ValueError("Technology prerequisites contain a cycle")
+
+
+class ResearchService(IResearchService):
+    def __init__(self, resource_manager: IResourceManager, catalog: Optional[BuildingCatalog] = None,
+                 tree: Optional[TechTree] = None):
+        self._rm = resource_manager
+        tree = tree or TechTree(catalog)
+        self._unlocked_techs: Set[str] = set()
+        self._tech_tree = tree.techs
+        self._kind_bits = tree.kind_bits
+        self._tech_bits = tree.tech_bits
+        self._dependents = tree.dependents
+        self._base_mask = tree.base_mask
+        self._rebuild_frontier()
+
+    def _rebuild_frontier(self) -> None:
+        self._unlocked_mask = self._base_mask
+        for name in self._unlocked_techs:
+            self._unlocked_mask |= self._tech_bits[name]
+        self._missing = {
+            name: sum(req not in self._unlocked_techs for req in tech['requires'])
+            for name, tech in self._tech_tree.items()
+        }
+        self._frontier = {
+            name: tech for name, tech in self._tech_tree.items()
+            if name not in self._unlocked_techs and self._missing[name] == 0
+        }
+
+    @property
+    def tech_tree(self) -> Mapping[str, dict]:
+        return self._tech_tree
+
+    def fork(self, resource_manager: IResourceManager) -> ResearchService:
+        research = copy.copy(self)
+        research._rm = resource_manager
+        research._unlocked_techs = set(self._unlocked_techs)
+        research._missing = dict(self._missing)
+        research._frontier = dict(self._frontier)
+        return research
+
+    def snapshot_state(self) -> List[str]:
+        return sorted(self._unlocked_techs)
+
+    def restore_state(self, state: List[str]) -> None:
+        self._unlocked_techs = set(state)
+        self._rebuild_frontier()
+
+    def get_available_techs(self) -> Dict[str, dict]:
+        return dict(self._frontier)
+
+    def is_building_unlocked(self, kind: str) -> bool:
+        return self._unlocked_mask & self._kind_bits.get(kind, 0) != 0
+
+    def research(self, tech_name: str) -> tuple[bool, str]:
+        if tech_name in self._unlocked_techs:
+            return False, "Already researched."
+        
+        tech = self._tech_tree.get(tech_name)
+        if not tech:
+            return False, "Unknown technology."
+
+        if tech_name not in self._frontier:
+            missing = [req for req in tech['requires'] if req not in self._unlocked_techs]
+            return False, f"Research {', '.join(missing)} first."
+        
+        cost = tech['cost']
+        if not self._rm.try_apply({'research_points': -cost}):
+            return False, f"Need {cost} Research Points."
+        
+        self._unlocked_techs.add(tech_name)
+        self._unlocked_mask |= self._tech_bits[tech_name]
+        del self._frontier[tech_name]
+        for dep in self._dependents[tech_name]:
+            self._missing[dep] -= 1
+            if self._missing[dep] == 0 and dep not in self._unlocked_techs:
+                self._frontier[dep] = self._tech_tree[dep]
+        return True, f"Researched '{tech_name}'! Unlocked: {', '.join(tech['unlocks_buildings'])}"
+
+
+BUY_FROM_CITY, SELL_TO_CITY = 0, 1
+OFFER_TYPES = ('BUY_FROM_CITY', 'SELL_TO_CITY')
+
+
+class OrderBook:
+    __slots__ = ('sides', 'goods', 'spreads', 'prices', 'amounts', 'pressure', 'rows_by_good', 'generation', '_offers')
+
+    def __init__(self, n_goods: int):
+        self.sides = array('b')
+        self.goods = array('H')
+        self.spreads = array('d')
+        self.prices = array('q')
+        self.amounts = array('q')
+        self.pressure = array('d', [1.0]) * n_goods
+        self.rows_by_good: List[List[int]] = [[] for _ in range(n_goods)]
+        self.generation = 0
+        self._offers: Optional[List[dict]] = None
+
+    def copy(self) -> OrderBook:
+        book = copy.copy(self)
+        book.sides = array('b', self.sides)
+        book.goods = array('H', self.goods)
+        book.spreads = array('d', self.spreads)
+        book.prices = array('q', self.prices)
+        book.amounts = array('q', self.amounts)
+        book.pressure = array('d', self.pressure)
+        book.rows_by_good = [list(rows) for rows in self.rows_by_good]
+        book._offers = None
+        return book
+
+    def clear(self) -> None:
+        for column in (self.sides, self.goods, self.spreads, self.prices, self.amounts):
+            del column[:]
+        for rows in self.rows_by_good:
+            rows.clear()
+        self._offers = None
+
+    def add(self, side: int, good: int, spread: float, price: int, amount: int) -> None:
+        self.rows_by_good[good].append(len(self.sides))
+        self.sides.append(side)
+        self.goods.append(good)
+        self.spreads.append(spread)
+        self.prices.append(price)
+        self.amounts.append(amount)
+
+    def offers(self, names: Sequence[str]) -> List[dict]:
+        if self._offers is None:
+            self._offers = [
+                {'type': OFFER_TYPES[side], 'resource': names[good], 'price_gold': price, 'amount': amount,
+                 'generation': self.generation}
+                for side, good, price, amount in zip(self.sides, self.goods, self.prices, self.amounts)
+            ]
+        return self._offers
+
+
+class TradingService(ITradingService):
+    def __init__(self, resource_manager: IResourceManager, rng: Optional[random.Random] = None,
+                 price_impact: float = 0.05, restock_every: int = 200, recovery: float = 0.5):
+        self._rm = resource_manager
+        self._rng = rng or random.Random()
+        
+        self._base_prices = {
+            'wood': 2, 'stone': 3, 'food': 2, 'coal': 4, 
+            'iron': 5, 'planks': 5, 'fish': 3, 'steel': 15,
+            'concrete': 10, 'water': 1
+        }
+        self._goods = tuple(self._base_prices)
+        self._good_base = tuple(self._base_prices.values())
+        self._good_rids = tuple(resource_manager.resource_id(r) for r in self._goods)
+        self._gold = resource_manager.resource_id('gold')
+        self._price_impact = price_impact
+        self._restock_every = restock_every
+        self._recovery = recovery
+        self._clock = 0
+        
+        self._available_cities = ["Kyiv", "Lviv", "Odesa", "Kharkiv", "Dnipro", "Poltava", "Vinnytsia"]
+        self._books: Dict[str, OrderBook] = {}
+        self._active_cities = []
+        
+        self._regenerate_market()
+
+    def _regenerate_market(self):
+        self._active_cities = self._rng.sample(self._available_cities, 3)
+        self._market_seed = self._rng.getrandbits(64)
+        self._books = {}
+        
+        for city in self._active_cities:
+            book = self._books[city] = OrderBook(len(self._goods))
+            self._generate_city_offers(city, book, 0)
+
+    def _generate_city_offers(self, city_name: str, book: OrderBook, generation: int) -> None:
+        # Each (city, generation) has its own stream, so when a book happens
+        # to be restocked never changes what any other draw returns.
+        rng = random.Random(f"{self._market_seed}/{city_name}/{generation}")
+        book.clear()
+        book.generation = generation
+        goods = range(len(self._goods))
+
+        for side, low, high in ((BUY_FROM_CITY, 1.2, 1.6), (SELL_TO_CITY, 0.7, 1.0)):
+            for good in rng.sample(goods, 4):
+                spread = rng.uniform(low, high)
+                book.add(side, good, spread, self._price(book, good, spread), 10)
+
+    def _price(self, book: OrderBook, good: int, spread: float) -> int:
+        return max(1, int(self._good_base[good] * spread * book.pressure[good]))
+
+    def _book(self, city_name: str) -> Optional[OrderBook]:
+        # Books restock every `restock_every` trades of the market clock, but
+        # lazily: only cities somebody looks at are recomputed. The result
+        # depends on the clock alone, not on when the book is looked at.
+        book = self._books.get(city_name)
+        generation = self._clock // self._restock_every
+        if book is not None and book.generation < generation:
+            recovery = self._recovery ** (generation - book.generation)
+            pressure = book.pressure
+            for good in range(len(pressure)):
+                pressure[good] = 1.0 + (pressure[good] - 1.0) * recovery
+            self._generate_city_offers(city_name, book, generation)
+        return book
+
+    def _reprice(self, book: OrderBook, good: int, side: int) -> None:
+        factor = 1.0 + self._price_impact if side == BUY_FROM_CITY else 1.0 - self._price_impact
+        book.pressure[good] = min(10.0, max(0.1, book.pressure[good] * factor))
+        for row in book.rows_by_good[good]:
+            book.prices[row] = self._price(book, good, book.spreads[row])
+        book._offers = None
+
+    def fork(self, resource_manager: IResourceManager) -> TradingService:
+        trading = copy.copy(self)
+        trading._rm = resource_manager
+        trading._rng = fork_rng(self._rng)
+        trading._active_cities = list(self._active_cities)
+        trading._books = {city: book.copy() for city, book in self._books.items()}
+        return trading
+
+    def snapshot_state(self) -> dict:
+        return {
+            'active_cities': list(self._active_cities),
+            'clock': self._clock,
+            'seed': self._market_seed,
+            'books': {
+                city: {
+                    'generation': book.generation,
+                    'pressure': list(book.pressure),
+                    'offers': [list(row) for row in zip(book.sides, book.goods, book.spreads, book.amounts)],
+                }
+                for city, book in self._books.items()
+            },
+        }
+
+    def restore_state(self, state: dict) -> None:
+        self._active_cities = list(state['active_cities'])
+        self._clock = state['clock']
+        self._market_seed = state['seed']
+        self._books = {}
+        for city, data in state['books'].items():
+            book = self._books[city] = OrderBook(len(self._goods))
+            book.generation = data['generation']
+            book.pressure = array('d', data['pressure'])
+            for side, good, spread, amount in data['offers']:
+                book.add(side, good, spread, self._price(book, good, spread), amount)
+
+    def get_active_cities(self) -> List[str]:
+        return self._active_cities
+
+    def get_offers(self, city_name: str) -> List[dict]:
+        book = self._book(city_name)
+        return book.offers(self._goods) if book is not None else []
+
+    def execute_trade(self, city_name: str, offer_index: int, generation: Optional[int] = None) -> tuple[bool, str]:
+        # `generation` is the one the caller's offers were listed with; a
+        # book restocked since then is not traded against blindly.
+        book = self._book(city_name)
+        if book is None or offer_index < 0 or offer_index >= len(book.sides):
+            return False, "Invalid offer."
+        if generation is not None and generation != book.generation:
+            return False, f"Offers in {city_name} were restocked. List them again."
+
+        side = book.sides[offer_index]
+        good = book.goods[offer_index]
+        res = self._goods[good]
+        amount = book.amounts[offer_index]
+        gold_price = book.prices[offer_index] * amount
+
+        if side == BUY_FROM_CITY:
+            if not self._rm.try_apply_ids(((self._gold, gold_price),), ((self._good_rids[good], amount),)):
+                return False, f"Not enough Gold! Need {gold_price}."
+            message = f"Bought {amount} {res} for {gold_price} Gold."
+        else:
+            if not self._rm.try_apply_ids(((self._good_rids[good], amount),), ((self._gold, gold_price),)):
+                return False, f"Not enough {res}! Need {amount}."
+            message = f"Sold {amount} {res} for {gold_price} Gold."
+
+        self._clock += 1
+        self._reprice(book, good, side)
+        return True, message
+
+    def execute_trades(self, trades: Iterable[tuple]) -> List[tuple[bool, str]]:
+        with self._rm.transaction():
+            return [self.execute_trade(*trade) for trade in trades]
+
+
+class RaidService(IRaidService):
+    # The raid model; execute_raid and estimate both read these.
+    base_chance = 40
+    ship_bonus = 10
+    roll_range = 100
+    loot_types = (3, 5)
+    loot_budget = 50
+    loot_spread = (0.5, 1.5)
+    ship_loss = (1, 2)
+
+    def __init__(self, resource_manager: IResourceManager, rng: Optional[random.Random] = None):
+        self._rm = resource_manager
+        self._rng = rng or random.Random()
+        self._loot_values = {
+            'wood': 2, 'stone': 3, 'food': 2, 'coal': 4,
+            'iron': 5, 'planks': 5, 'fish': 3, 'steel': 15,
+            'concrete': 10, 'gold': 1
+        }
+
+    @property
+    def loot_values(self) -> Mapping[str, int]:
+        return self._loot_values
+
+    def fork(self, resource_manager: IResourceManager) -> RaidService:
+        raid = copy.copy(self)
+        raid._rm = resource_manager
+        raid._rng = fork_rng(self._rng)
+        return raid
+
+    def snapshot_state(self) -> dict:
+        return {'rng': rng_state(self._rng)}
+
+    def restore_state(self, state: dict) -> None:
+        restore_rng(self._rng, state['rng'])
+
+    def execute_raid(self) -> tuple[bool, str]:
+        ships = self._rm.get_amount('ship')
+        if ships <= 0:
+            return False, "You have 0 ships! Build a fleet first."
+
+        base_chance = self._rng.uniform(0, self.base_chance)
+        ship_bonus = ships * self.ship_bonus
+        win_chance = base_chance + ship_bonus
+        
+        roll = self._rng.uniform(0, self.roll_range)
+        is_victory = roll <= win_chance
+
+        if is_victory:
+            num_rewards = self._rng.randint(*self.loot_types)
+            possible_loot = list(self._loot_values.keys())
+            loot_types = self._rng.sample(possible_loot, num_rewards)
+            
+            loot = {}
+            for r in loot_types:
+                price = self._loot_values[r]
+                base_qty = self.loot_budget / price 
+                loot[r] = max(1, int(base_qty * self._rng.uniform(*self.loot_spread)))
+            self._rm.try_apply(loot)
+            loot_msg = [f"{qty} {r}" for r, qty in loot.items()]
+            
+            return True, f"VICTORY! (Chance: {int(win_chance)}%) Loot: {', '.join(loot_msg)}"
+        else:
+            loss = self._rng.randint(*self.ship_loss)
+            actual_loss = min(ships, loss)
+            self._rm.consume_resource('ship', actual_loss)
+            return False, f"DEFEAT! (Chance: {int(win_chance)}%) You lost {actual_loss} ship(s)."
+
+    def estimate(self, ships: Optional[int] = None, samples: int = 100_000,
+                 seed: Optional[int] = None) -> RaidEstimate:
+        from engine import estimate_raids
+        if ships is None:
+            ships = self._rm.get_amount('ship')
+        return estimate_raids(self, ships, samples, seed)
+
+
+class GameService:
+    ship_cost = {'planks': 50, 'steel': 10, 'energy': 20}
+
+    def __init__(self, 
+                 rm: IResourceManager, 
+                 br: BuildingRepository, 
+                 factory: IBuildingFactory, 
+                 constr: IConstructionService, 
+                 prod: IProductionService, 
+                 research: IResearchService, 
+                 trading: ITradingService, 
+                 raid: IRaidService,
+                 catalog: Optional[BuildingCatalog] = None):
+        self._rm = rm
+        self._br = br
+        self._factory = factory
+        self._constr = constr
+        self._prod = prod
+        self._research = research
+        self._trading = trading
+        self._raid = raid
+        
+        self._catalog = catalog or load_catalog()
+
+    _DEPENDENCIES = {
+        '_rm': 'resource_manager', '_br': 'building_repo', '_factory': 'building_factory',
+        '_constr': 'construction_service', '_prod': 'production_service', '_research': 'research_service',
+        '_trading': 'trading_service', '_raid': 'raid_service', '_catalog': 'building_catalog',
+    }
+
+    @classmethod
+    def from_container(cls, container: IContainer) -> GameService:
+        # Each service is resolved the first time a call needs it, so a
+        # session only builds what it uses.
+        gs = cls.__new__(cls)
+        gs._container = container
+        return gs
+
+    def __getattr__(self, name: str):
+        key = self._DEPENDENCIES.get(name)
+        container = self.__dict__.get('_container')
+        if key is None or container is None:
+            raise AttributeError(name)
+        value = container.resolve(key)
+        setattr(self, name, value)
+        return value
+
+    def list_resources(self) -> Dict[str, int]:
+        return dict(zip(self._rm._repo.names, self._rm.amounts))
+
+    def list_buildings(self) -> List[Building]:
+        return self._br.all()
+
+    def get_building_catalog(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        return self._catalog.categories()
+
+    def list_research(self) -> Dict[str, dict]:
+        return self._research.get_available_techs()
+
+    def research_tech(self, tech_name: str) -> tuple[bool, str]:
+        return self._research.research(tech_name)
+
+    def build(self, kind: str) -> tuple[bool, str]:
+        if not self._research.is_building_unlocked(kind):
+            return False, "Technology locked! Research it first."
+
+        bp = self._catalog.blueprint(kind)
+        if bp is None:
+            return False, f"Unknown blueprint for {kind}"
+
+        if not self._rm.has_resource('people', 2):
+             return False, "Not enough idle people (need 2) to build"
+        
+        b = self._constr.build(bp, lambda: self._factory.create(kind))
+        if b is None:
+            return False, f"Insufficient resources for {kind}: {bp}"
+            
+        return True, f"Built {b.summary()}"
+
+    def build_ship(self) -> tuple[bool, str]:
+        if not self._br.has_kind('port'):
+            return False, "You need a PORT to build ships!"
+        
+        cost = self.ship_cost
+        
+        if not self._rm.try_apply({**{r: -amount for r, amount in cost.items()}, 'ship': 1}):
+            return False, f"Not enough resources for Ship: {cost}"
+        return True, "Ship launched successfully! (+1 Fleet)"
+
+    def upgrade(self, building_id: int) -> tuple[bool, str]:
+        return self._constr.upgrade_building(building_id)
+
+    def add_resources(self, amounts: Dict[str, int]) -> None:
+        for name, amount in amounts.items():
+            self._rm.add_resource(name, amount)
+
+    def tick(self) -> None:
+        self._prod.tick()
+
+    def advance(self, n_ticks: int) -> AdvanceReport:
+        return self._prod.advance(n_ticks)
+
+    def set_instrumentation(self, probe: Optional[ITickProbe]) -> None:
+        self._prod.set_instrumentation(probe)
+
+    def set_history(self, history: Optional[IResourceHistory]) -> None:
+        self._prod.set_history(history)
+
+    def get_trading_cities(self) -> List[str]:
+        if not self._br.has_kind('logistics_center'):
+            return []
+        return self._trading.get_active_cities()
+
+    def get_city_offers(self, city: str) -> List[dict]:
+        return self._trading.get_offers(city)
+
+    def trade(self, city: str, offer_idx: int, generation: Optional[int] = None) -> tuple[bool, str]:
+        if not self._br.has_kind('logistics_center'):
+            return False, "Build Logistics Center first!"
+        return self._trading.execute_trade(city, offer_idx, generation)
+
+    def trade_many(self, trades: Iterable[tuple]) -> List[tuple[bool, str]]:
+        if not self._br.has_kind('logistics_center'):
+            return [(False, "Build Logistics Center first!") for _ in trades]
+        return self._trading.execute_trades(trades)
+
+    def raid(self) -> tuple[bool, str]:
+        return self._raid.execute_raid()
+
+    def estimate_raid(self, samples: int = 100_000, seed: Optional[int] = None) -> RaidEstimate:
+        return self._raid.estimate(samples=samples, seed=seed)
+
+
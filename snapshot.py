@@ -0,0 +1,146 @@
+from __future__ import annotations
+import json
+import mmap
+import struct
+from array import array
+from typing import List
+
+from container import Container, build_container
+from entities import ProducerBuilding
+from repositories import CompactBuildingRepository
+
+MAGIC = b'CITYSNAP'
+SNAPSHOT_VERSION = 2
+HEADER = struct.Struct('<8sII')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _building_columns(repo) -> tuple:
+    if isinstance(repo, CompactBuildingRepository):
+        ids, codes, levels, kind_rows, producer_rows, ids_sorted = repo.columns()
+        return list(repo._kind_names), ids, codes, levels, kind_rows, producer_rows, ids_sorted
+
+    kinds: List[str] = []
+    lookup = {}
+    ids, codes, levels, producer_rows = array('q'), array('H'), array('H'), array('q')
+    kind_rows: List[array] = []
+    for row, b in enumerate(repo):
+        code = lookup.get(b.kind)
+        if code is None:
+            code = lookup[b.kind] = len(kinds)
+            kinds.append(b.kind)
+            kind_rows.append(array('q'))
+        ids.append(b.id)
+        codes.append(code)
+        levels.append(b.level)
+        kind_rows[code].append(row)
+        if isinstance(b, ProducerBuilding):
+            producer_rows.append(row)
+    ids_sorted = all(ids[i] < ids[i + 1] for i in range(len(ids) - 1))
+    return kinds, ids, codes, levels, kind_rows, producer_rows, ids_sorted
+
+
+def save_snapshot(c: Container, path: str) -> None:
+    res_repo = c.resolve('resource_repo')
+    kinds, ids, codes, levels, kind_rows, producer_rows, ids_sorted = _building_columns(c.resolve('building_repo'))
+
+    blocks = []
+    offset = 0
+
+    def block(column, itemsize: int) -> list:
+        nonlocal offset
+        data = memoryview(column).cast('B')
+        span = [offset, len(data) // itemsize]
+        blocks.append(data)
+        offset = _align(offset + len(data))
+        return span
+
+    meta = {
+        'resources': {
+            'names': list(res_repo.names),
+            'amounts': list(res_repo.amounts),
+            'capacities': list(res_repo.capacities),
+        },
+        'factory': c.resolve('building_factory').snapshot_state(),
+        'research': c.resolve('research_service').snapshot_state(),
+        'market': c.resolve('trading_service').snapshot_state(),
+        'raid': c.resolve('raid_service').snapshot_state(),
+        'buildings': {
+            'kinds': kinds,
+            'ids_sorted': ids_sorted,
+            'ids': block(ids, 8),
+            'kind_codes': block(codes, 2),
+            'levels': block(levels, 2),
+            'kind_rows': [block(rows, 8) for rows in kind_rows],
+            'producer_rows': block(producer_rows, 8),
+        },
+    }
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, SNAPSHOT_VERSION, len(meta_bytes)))
+        f.write(meta_bytes)
+        f.write(b'\0' * (_align(HEADER.size + len(meta_bytes)) - HEADER.size - len(meta_bytes)))
+        written = 0
+        for data in blocks:
+            f.write(data)
+            written += len(data)
+            f.write(b'\0' * (_align(written) - written))
+            written = _align(written)
+
+
+def load_snapshot(path: str, **container_kwargs) -> Container:
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    view = memoryview(mm)
+
+    magic, version, meta_len = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise SnapshotError(f"{path} is not a city snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION})")
+    meta = json.loads(bytes(view[HEADER.size:HEADER.size + meta_len]))
+    base = _align(HEADER.size + meta_len)
+
+    def column(span: list, typecode: str, itemsize: int) -> memoryview:
+        offset, count = span
+        return view[base + offset:base + offset + count * itemsize].cast(typecode)
+
+    container_kwargs.setdefault('compact', True)
+    c = build_container(**container_kwargs)
+
+    res_repo = c.resolve('resource_repo')
+    resources = meta['resources']
+    for name, amount, capacity in zip(resources['names'], resources['amounts'], resources['capacities']):
+        rid = res_repo.intern(name)
+        res_repo.amounts[rid] = amount
+        res_repo.capacities[rid] = capacity
+
+    factory = c.resolve('building_factory')
+    c.resolve('research_service').restore_state(meta['research'])
+    c.resolve('trading_service').restore_state(meta['market'])
+    c.resolve('raid_service').restore_state(meta['raid'])
+
+    blds = meta['buildings']
+    ids = column(blds['ids'], 'q', 8)
+    codes = column(blds['kind_codes'], 'H', 2)
+    levels = column(blds['levels'], 'H', 2)
+    repo = c.resolve('building_repo')
+    if isinstance(repo, CompactBuildingRepository):
+        prototypes = [factory.restore(kind, 0, 1) for kind in blds['kinds']]
+        kind_rows = [column(span, 'q', 8) for span in blds['kind_rows']]
+        repo.load_columns(prototypes, ids, codes, levels, kind_rows,
+                          column(blds['producer_rows'], 'q', 8), blds['ids_sorted'])
+    else:
+        kinds = blds['kinds']
+        for bid, code, level in zip(ids, codes, levels):
+            repo.add(factory.restore(kinds[code], bid, level))
+    factory.restore_state(meta['factory'])
+    return c
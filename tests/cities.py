@@ -0,0 +1,46 @@
+from __future__ import annotations
+import json
+import random
+from typing import Optional
+
+from catalog import DEFAULT_CATALOG_PATH
+from container import Container, build_container
+
+# A producer that consumes one of its own outputs, so stacks of it take the
+# per-building fallback path.
+RECYCLER = {'industry': {'recycler': {
+    'cost': {'wood': 1}, 'produces': {'stone': 3, 'sand': 1}, 'consumes': {'stone': 2, 'energy': 1},
+}}}
+
+
+def write_recycler_catalog(tmp_path) -> str:
+    path = tmp_path / 'recycler.json'
+    path.write_text(json.dumps(RECYCLER))
+    return str(path)
+
+
+def random_city(seed: int, extra_catalog: Optional[str] = None, **container_kwargs) -> Container:
+    rng = random.Random(seed)
+    paths = (DEFAULT_CATALOG_PATH, extra_catalog) if extra_catalog and rng.random() < 0.3 else ()
+    c = build_container(seed=seed, catalog_paths=paths, **container_kwargs)
+    factory = c.resolve('building_factory')
+    construction = c.resolve('construction_service')
+    rm = c.resolve('resource_manager')
+    repo = c.resolve('building_repo')
+
+    kinds = [spec.kind for spec in c.resolve('building_catalog')]
+    pool = rng.sample(kinds, rng.randint(1, 6))
+    if paths:
+        pool.append('recycler')
+    for _ in range(rng.randint(1, 40)):
+        construction.build({}, lambda: factory.create(rng.choice(pool)))
+
+    tight = rng.random() < 0.5
+    for name in list(rm._repo.names):
+        rid = rm.resource_id(name)
+        if tight:
+            rm.capacities[rid] = rng.choice([100, 10 ** 4, 10 ** 6, 10 ** 9])
+        rm.add_resource(name, rng.randint(0, 500))
+    for b in list(repo)[:rng.randint(0, 5)]:
+        repo.upgrade(b.id)
+    return c
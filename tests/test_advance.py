@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from container import build_container
+from entities import expand_ticks
+from services import ProductionService
+from cities import random_city, write_recycler_catalog
+
+
+def _reference(c, n_ticks: int) -> tuple:
+    # n plain tick() calls; the flags come from the warnings tick() logs.
+    gs = c.resolve('game_service')
+    logger = c.resolve('logger')
+    rm = c.resolve('resource_manager')
+    logger.drain()
+    starved, dry, clamped = [], [], 0
+    for t in range(n_ticks):
+        gs.tick()
+        events = {event.fields.get('event') for event in logger.drain()}
+        if 'starvation' in events:
+            starved.append(t)
+        if 'drought' in events:
+            dry.append(t)
+        clamped += any(0 < a == cap for a, cap in zip(rm.amounts, rm.capacities))
+    return starved, dry, clamped
+
+
+def _assert_advance_matches(make_city, n_ticks: int) -> tuple:
+    ticked, advanced = make_city(), make_city()
+    starved, dry, clamped = _reference(ticked, n_ticks)
+    report = advanced.resolve('game_service').advance(n_ticks)
+    assert advanced.resolve('game_service').list_resources() == ticked.resolve('game_service').list_resources()
+    assert expand_ticks(report.starvation_ticks) == starved
+    assert expand_ticks(report.drought_ticks) == dry
+    return starved, dry, clamped
+
+
+@pytest.fixture
+def horizons(monkeypatch):
+    # Counts the linear skips advance() actually takes.
+    taken = []
+    original = ProductionService._linear_horizon
+
+    def spy(self, x, d, plan):
+        result = original(self, x, d, plan)
+        if result[0] >= 0:
+            taken.append(result[0])
+        return result
+    monkeypatch.setattr(ProductionService, '_linear_horizon', spy)
+    return taken
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_advance_matches_ticks_on_random_cities(vectorized, horizons, tmp_path):
+    extra = write_recycler_catalog(tmp_path)
+    starvation = drought = clamps = 0
+    for seed in range(80):
+        n_ticks = random.Random(seed).choice([1, 2, 5, 50, 500, 2000])
+        starved, dry, clamped = _assert_advance_matches(
+            lambda: random_city(seed, extra, vectorized=vectorized, compact=seed % 3 == 0), n_ticks)
+        starvation += bool(starved)
+        drought += bool(dry)
+        clamps += bool(clamped)
+    # The cities must exercise every kind of tick the skip has to predict.
+    assert starvation and drought and clamps and horizons
+
+
+def _growing_city(capacity: int, water: int, food: int, people: int):
+    def make():
+        c = build_container(seed=0)
+        rm = c.resolve('resource_manager')
+        for rid in range(len(rm.amounts)):
+            rm.capacities[rid] = capacity
+        gs = c.resolve('game_service')
+        gs.add_resources({'wood': 1000, 'stone': 1000, 'people': people, 'water': water, 'food': food})
+        construction = c.resolve('construction_service')
+        factory = c.resolve('building_factory')
+        for kind in ['lumber_mill'] * 5 + ['quarry'] * 3 + ['farm'] * 2:
+            construction.build({}, lambda: factory.create(kind))
+        return c
+    return make
+
+
+@pytest.mark.parametrize('capacity, water, food, people', [
+    (5_000, 10 ** 6, 10 ** 6, 50),   # wood climbs into its capacity mid-skip
+    (10 ** 9, 0, 10 ** 6, 50),       # drought every tick, people die out first
+    (10 ** 9, 10 ** 6, 0, 400),      # starvation until food and people balance
+    (10 ** 9, 3_000, 3_000, 100),    # water runs out partway through a skip
+])
+def test_advance_matches_ticks_across_regime_changes(capacity, water, food, people, horizons):
+    _assert_advance_matches(_growing_city(capacity, water, food, people), 20_000)
+    assert horizons
+
+
+def test_advance_matches_ticks_through_boom_and_starvation_cycles():
+    # Houses outgrow the farms, the city starves back down and the amounts
+    # repeat, so advance() replays whole periods with mixed flags.
+    def make():
+        c = build_container(seed=0)
+        c.resolve('game_service').add_resources({'people': 20, 'food': 50})
+        construction = c.resolve('construction_service')
+        factory = c.resolve('building_factory')
+        for kind in ('farm', 'farm', 'house', 'house'):
+            construction.build({}, lambda: factory.create(kind))
+        return c
+    starved, _, _ = _assert_advance_matches(make, 3000)
+    assert 0 < len(starved) < 3000
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from catalog import DEFAULT_CATALOG_PATH, CatalogError, load_catalog
+from container import build_container
+
+
+def _mod(tmp_path, entries: dict) -> str:
+    path = tmp_path / 'mod.json'
+    path.write_text(json.dumps({'mod': entries}))
+    return str(path)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_producer_with_capacity_applies_it(tmp_path, compact):
+    mod = _mod(tmp_path, {
+        'silo': {'produces': {'food': 1}, 'adds_capacity': {'food': 500}},
+        'water_tower': {'class': 'water_tower', 'produces': {'water': 10}, 'consumes': {'energy': 1},
+                        'adds_capacity': {'water': 450}},
+    })
+    c = build_container(compact=compact, catalog_paths=(DEFAULT_CATALOG_PATH, mod))
+    rm = c.resolve('resource_manager')
+    factory = c.resolve('building_factory')
+    construction = c.resolve('construction_service')
+    food, water = rm.get_capacity('food'), rm.get_capacity('water')
+
+    silo = construction.build({}, lambda: factory.create('silo'))
+    tower = construction.build({}, lambda: factory.create('water_tower'))
+    assert rm.get_capacity('food') == food + 500
+    assert rm.get_capacity('water') == water + 450
+    assert silo.summary().endswith("[Cap: +500 Food]")
+    assert tower.summary().endswith("[Cap: +450 Water]")
+    viewed = {b.kind: b.summary() for b in c.resolve('building_repo')}
+    assert viewed['water_tower'] == tower.summary()
+
+
+def test_capacity_on_a_class_that_cannot_apply_it(tmp_path):
+    mod = _mod(tmp_path, {'silo': {'class': 'producer', 'produces': {'food': 1}, 'adds_capacity': {'food': 500}}})
+    with pytest.raises(CatalogError):
+        load_catalog(DEFAULT_CATALOG_PATH, mod)
@@ -0,0 +1,20 @@
+import pytest
+
+from batch import run_city
+from container import build_container, build_root
+
+
+def test_cities_share_root_catalog():
+    root = build_root()
+    a, b = build_container(seed=1, root=root), build_container(seed=2, root=root)
+    assert a.resolve('building_catalog') is b.resolve('building_catalog')
+
+
+@pytest.mark.parametrize('option', [{'vectorized': True}, {'compact': True}, {'catalog_paths': ['x.json']},
+                                    {'history': True}])
+def test_root_with_options_is_rejected(option):
+    root = build_root()
+    with pytest.raises(ValueError):
+        build_container(root=root, **option)
+    with pytest.raises(ValueError):
+        run_city(0, [], root=root, **option)
@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from container import build_container
+from repositories import BuildingRepository, CompactBuildingRepository
+from services import BuildingFactory
+
+KINDS = ['farm', 'house', 'lumber_mill', 'warehouse', 'water_tower', 'park']
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_load_columns_resyncs_production(vectorized):
+    c = build_container(compact=True, vectorized=vectorized)
+    factory = c.resolve('building_factory')
+    c.resolve('construction_service').build({}, lambda: factory.create('farm'))
+    gs = c.resolve('game_service')
+    gs.tick()
+
+    source = CompactBuildingRepository()
+    for _ in range(2):
+        source.add(factory.create('lumber_mill'))
+    repo = c.resolve('building_repo')
+    version = repo.version
+    repo.load_columns([factory.restore('lumber_mill', 0, 1)], *source.columns())
+    assert repo.version > version
+
+    wood = gs.list_resources()['wood']
+    gs.tick()
+    assert gs.list_resources()['wood'] - wood == 10
+
+
+def _state(repo) -> tuple:
+    stacks = sorted((s.kind, s.level, s.count) for s in repo.stacks() if s.count)
+    return (
+        [(b.id, b.kind, b.level) for b in repo],
+        sorted((b.id, b.level) for b in repo.producers()),
+        {kind: [b.id for b in repo.by_kind(kind)] for kind in KINDS if repo.has_kind(kind)},
+        stacks,
+        len(repo),
+    )
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_compact_forks_match_object_forks(seed):
+    rng = random.Random(seed)
+    factory = BuildingFactory()
+    compact, objects = CompactBuildingRepository(), BuildingRepository()
+    if rng.random() < 0.5:
+        # Start from read-only buffers, as a memory-mapped snapshot does.
+        source = CompactBuildingRepository()
+        for _ in range(rng.randint(0, 30)):
+            b = factory.create(rng.choice(KINDS))
+            source.add(b)
+            objects.add(factory.restore(b.kind, b.id, b.level))
+        ids, codes, levels, kind_rows, producer_rows, ids_sorted = source.columns()
+        prototypes = [factory.restore(kind, 0, 1) for kind in source._kind_names]
+        compact.load_columns(prototypes, memoryview(ids).toreadonly(), memoryview(codes).toreadonly(),
+                             memoryview(levels), [memoryview(rows).toreadonly() for rows in kind_rows],
+                             memoryview(producer_rows).toreadonly(), ids_sorted)
+    pairs = [(compact, objects)]
+    for _ in range(300):
+        i = rng.randrange(len(pairs))
+        a, b = pairs[i]
+        op = rng.random()
+        if op < 0.15:
+            pairs.append((a.fork(), b.fork()))
+        elif op < 0.55:
+            kind = rng.choice(KINDS)
+            bid = rng.randint(1, 10 ** 6) if rng.random() < 0.1 else None
+            built = factory.create(kind) if bid is None else factory.restore(kind, bid, 1)
+            if bid is not None and b.get(bid) is not None:
+                continue
+            a.add(built)
+            b.add(factory.restore(kind, built.id, 1))
+        elif len(b):
+            bid = rng.choice([x.id for x in b])
+            assert a.upgrade(bid).level == b.upgrade(bid).level
+            assert a.get(bid).level == b.get(bid).level
+    for a, b in pairs:
+        assert _state(a) == _state(b)
+        assert [x.id for x in a.all()] == [x.id for x in b.all()]
+
+
+def test_compact_fork_chain_is_flattened():
+    factory = BuildingFactory()
+    repo = CompactBuildingRepository()
+    ids = []
+    for _ in range(CompactBuildingRepository.max_depth * 2):
+        b = factory.create('farm')
+        repo.add(b)
+        ids.append(b.id)
+        repo.upgrade(ids[0])
+        repo = repo.fork()
+    assert repo._depth <= CompactBuildingRepository.max_depth
+    assert [b.id for b in repo] == ids
+    assert repo.get(ids[0]).level == 1 + CompactBuildingRepository.max_depth * 2
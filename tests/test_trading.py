@@ -0,0 +1,48 @@
+from container import build_container
+from journal import Journal, JournalingGameService, replay
+
+
+def _trading_session(path: str, seed: int, look: bool) -> JournalingGameService:
+    gs = JournalingGameService(build_container(seed=seed).resolve('game_service'), Journal(path, seed))
+    refill = {name: 1000 for name in gs.list_resources()}
+    gs.add_resources(refill)
+    for tech in ('basic_logistics', 'trade_logistics'):
+        gs.research_tech(tech)
+    gs.build('warehouse')
+    gs.add_resources(refill)
+    assert gs.build('logistics_center')[0]
+    cities = gs.get_trading_cities()
+    for i in range(700):
+        if i % 10 == 0:
+            gs.add_resources(refill)
+        if look:
+            for city in cities:
+                gs.get_city_offers(city)
+        gs.trade(cities[i % len(cities)], i % 8)
+    gs._journal.close()
+    return gs
+
+
+def test_viewing_offers_does_not_change_replay(tmp_path):
+    looked = _trading_session(str(tmp_path / 'looked.jrnl'), 5, look=True)
+    blind = _trading_session(str(tmp_path / 'blind.jrnl'), 5, look=False)
+    assert looked.list_resources() == blind.list_resources()
+    replayed = replay(str(tmp_path / 'looked.jrnl')).resolve('game_service')
+    assert replayed.list_resources() == looked.list_resources()
+
+
+def test_trade_against_restocked_book_is_rejected(tmp_path):
+    trading = build_container(seed=2).resolve('trading_service')
+    trading._rm.increase_capacity('gold', 10 ** 6)
+    trading._rm.add_resource('gold', 10 ** 6)
+    city = trading.get_active_cities()[0]
+    offers = trading.get_offers(city)
+    buy = next(i for i, offer in enumerate(offers) if offer['type'] == 'BUY_FROM_CITY')
+    generation = offers[buy]['generation']
+
+    assert trading.execute_trade(city, buy, generation)[0]
+    for _ in range(trading._restock_every):
+        trading.execute_trade(city, buy)
+    ok, msg = trading.execute_trade(city, buy, generation)
+    assert not ok and 'restocked' in msg
+    assert trading.get_offers(city)[buy]['generation'] == generation + 1